@@ -2,19 +2,124 @@
 CrewAI Crew definition for transaction analysis.
 """
 
+import asyncio
+import hashlib
 import os
 from crewai import Agent, Task, Crew, Process, LLM
 
 from .tools import get_analysis_tools
 
+# Ollama configuration
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2")
 
-def create_analysis_crew():
-    """Create and return the transaction analysis crew."""
+# Agent and task prompts are module constants: any edit changes the prompt
+# prefix, invalidating Ollama's prompt cache and every cached analysis
+# (see analysis_fingerprint), so keep them stable.
+SPENDING_ANALYST_ROLE = "Spending Analyst"
+SPENDING_ANALYST_GOAL = "Analyze spending patterns and identify key insights from transaction data"
+SPENDING_ANALYST_BACKSTORY = (
+    "You are an expert financial analyst specializing in personal spending patterns. "
+    "You excel at finding trends and summarizing where money goes."
+)
+
+BUDGET_ADVISOR_ROLE = "Budget Advisor"
+BUDGET_ADVISOR_GOAL = "Provide actionable budget recommendations based on spending analysis"
+BUDGET_ADVISOR_BACKSTORY = (
+    "You are a certified financial planner who helps people optimize their budgets. "
+    "You find opportunities to save money and give practical advice."
+)
+
+ANOMALY_DETECTOR_ROLE = "Anomaly Detector"
+ANOMALY_DETECTOR_GOAL = "Identify unusual transactions, duplicates, and potential issues"
+ANOMALY_DETECTOR_BACKSTORY = (
+    "You are a fraud detection specialist with a keen eye for unusual patterns. "
+    "You spot duplicate charges and unusually large transactions."
+)
+
+SPENDING_ANALYSIS_DESCRIPTION = (
+    "Analyze the user's spending patterns:\n"
+    "1. Use 'Get Category Stats' to get spending breakdown\n"
+    "2. Use 'Get Monthly Trends' to identify trends over time\n"
+    "3. Identify the top 3 spending categories\n"
+    "4. Note any significant changes in spending patterns\n\n"
+    "Provide a clear, concise summary."
+)
+SPENDING_ANALYSIS_OUTPUT = (
+    "A spending analysis summary with:\n"
+    "- Total spending amount\n"
+    "- Top 3 categories with amounts\n"
+    "- Monthly trend (increasing/decreasing)\n"
+    "- Key insight"
+)
+
+BUDGET_ADVICE_DESCRIPTION = (
+    "Based on the spending analysis, provide budget recommendations:\n"
+    "1. Identify categories where spending could be reduced\n"
+    "2. Suggest specific ways to save money\n"
+    "3. Recommend one actionable next step\n\n"
+    "Be practical and specific."
+)
+BUDGET_ADVICE_OUTPUT = (
+    "Budget recommendations with:\n"
+    "- 2-3 areas for spending reduction\n"
+    "- Practical tips\n"
+    "- Estimated monthly savings\n"
+    "- One actionable next step"
+)
+
+ANOMALY_DETECTION_DESCRIPTION = (
+    "Use 'Detect Anomalies' tool to find unusual transactions. "
+    "The tool returns a markdown table with flagged transactions. "
+    "Copy that table exactly to your final answer and add recommendations."
+)
+ANOMALY_DETECTION_OUTPUT = (
+    "A markdown table like this:\n\n"
+    "| Date | Description | Amount | Type | Reason |\n"
+    "| --- | --- | --- | --- | --- |\n"
+    "| 2024-05-16 | Gift Card Purchase | $500.00 | Unusually Large | 14.3x median |\n"
+    "| 2024-12-30 | DELTA DELTA.COM | $312.56 | Unusually Large | 8.9x median |\n\n"
+    "Then add: Recommended Actions: (list 2-3 actions)"
+)
+
+
+def analysis_fingerprint() -> str:
+    """
+    Hash the model and every agent and task prompt.
+    
+    Cached analyses are keyed by this (plus the data), so changing the model
+    or editing a prompt invalidates them.
+    
+    Returns:
+        SHA-256 hex digest
+    """
+    parts = [
+        OLLAMA_MODEL,
+        SPENDING_ANALYST_ROLE, SPENDING_ANALYST_GOAL, SPENDING_ANALYST_BACKSTORY,
+        BUDGET_ADVISOR_ROLE, BUDGET_ADVISOR_GOAL, BUDGET_ADVISOR_BACKSTORY,
+        ANOMALY_DETECTOR_ROLE, ANOMALY_DETECTOR_GOAL, ANOMALY_DETECTOR_BACKSTORY,
+        SPENDING_ANALYSIS_DESCRIPTION, SPENDING_ANALYSIS_OUTPUT,
+        BUDGET_ADVICE_DESCRIPTION, BUDGET_ADVICE_OUTPUT,
+        ANOMALY_DETECTION_DESCRIPTION, ANOMALY_DETECTION_OUTPUT,
+    ]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+
+def create_analysis_crews():
+    """
+    Create and return the transaction analysis crews.
+    
+    Budget advice depends on the spending analysis, but anomaly detection is
+    independent, so it runs in its own crew alongside the spending→budget chain.
+    
+    Returns:
+        Tuple of (spending/budget crew, anomaly detection crew)
+    """
     
     # Configure Ollama LLM
     llm = LLM(
-        model="ollama/llama3.2",
-        base_url="http://localhost:11434",
+        model=f"ollama/{OLLAMA_MODEL}",
+        base_url=OLLAMA_URL,
     )
     
     # Get all tools
@@ -22,109 +127,79 @@ def create_analysis_crew():
     
     # Define Agents
     spending_analyst = Agent(
-        role="Spending Analyst",
-        goal="Analyze spending patterns and identify key insights from transaction data",
-        backstory=(
-            "You are an expert financial analyst specializing in personal spending patterns. "
-            "You excel at finding trends and summarizing where money goes."
-        ),
+        role=SPENDING_ANALYST_ROLE,
+        goal=SPENDING_ANALYST_GOAL,
+        backstory=SPENDING_ANALYST_BACKSTORY,
         tools=tools,
         llm=llm,
+        cache=True,
         verbose=True,
     )
     
     budget_advisor = Agent(
-        role="Budget Advisor",
-        goal="Provide actionable budget recommendations based on spending analysis",
-        backstory=(
-            "You are a certified financial planner who helps people optimize their budgets. "
-            "You find opportunities to save money and give practical advice."
-        ),
+        role=BUDGET_ADVISOR_ROLE,
+        goal=BUDGET_ADVISOR_GOAL,
+        backstory=BUDGET_ADVISOR_BACKSTORY,
         tools=tools,
         llm=llm,
+        cache=True,
         verbose=True,
     )
     
     anomaly_detector = Agent(
-        role="Anomaly Detector",
-        goal="Identify unusual transactions, duplicates, and potential issues",
-        backstory=(
-            "You are a fraud detection specialist with a keen eye for unusual patterns. "
-            "You spot duplicate charges and unusually large transactions."
-        ),
+        role=ANOMALY_DETECTOR_ROLE,
+        goal=ANOMALY_DETECTOR_GOAL,
+        backstory=ANOMALY_DETECTOR_BACKSTORY,
         tools=tools,
         llm=llm,
+        cache=True,
         verbose=True,
     )
     
     # Define Tasks
     spending_analysis_task = Task(
-        description=(
-            "Analyze the user's spending patterns:\n"
-            "1. Use 'Get Category Stats' to get spending breakdown\n"
-            "2. Use 'Get Monthly Trends' to identify trends over time\n"
-            "3. Identify the top 3 spending categories\n"
-            "4. Note any significant changes in spending patterns\n\n"
-            "Provide a clear, concise summary."
-        ),
-        expected_output=(
-            "A spending analysis summary with:\n"
-            "- Total spending amount\n"
-            "- Top 3 categories with amounts\n"
-            "- Monthly trend (increasing/decreasing)\n"
-            "- Key insight"
-        ),
+        description=SPENDING_ANALYSIS_DESCRIPTION,
+        expected_output=SPENDING_ANALYSIS_OUTPUT,
         agent=spending_analyst,
     )
     
     budget_advice_task = Task(
-        description=(
-            "Based on the spending analysis, provide budget recommendations:\n"
-            "1. Identify categories where spending could be reduced\n"
-            "2. Suggest specific ways to save money\n"
-            "3. Recommend one actionable next step\n\n"
-            "Be practical and specific."
-        ),
-        expected_output=(
-            "Budget recommendations with:\n"
-            "- 2-3 areas for spending reduction\n"
-            "- Practical tips\n"
-            "- Estimated monthly savings\n"
-            "- One actionable next step"
-        ),
+        description=BUDGET_ADVICE_DESCRIPTION,
+        expected_output=BUDGET_ADVICE_OUTPUT,
         agent=budget_advisor,
     )
     
     anomaly_detection_task = Task(
-        description=(
-            "Use 'Detect Anomalies' tool to find unusual transactions. "
-            "The tool returns a markdown table with flagged transactions. "
-            "Copy that table exactly to your final answer and add recommendations."
-        ),
-        expected_output=(
-            "A markdown table like this:\n\n"
-            "| Date | Description | Amount | Type | Reason |\n"
-            "| --- | --- | --- | --- | --- |\n"
-            "| 2024-05-16 | Gift Card Purchase | $500.00 | Unusually Large | 14.3x average |\n"
-            "| 2024-12-30 | DELTA DELTA.COM | $312.56 | Unusually Large | 8.9x average |\n\n"
-            "Then add: Recommended Actions: (list 2-3 actions)"
-        ),
+        description=ANOMALY_DETECTION_DESCRIPTION,
+        expected_output=ANOMALY_DETECTION_OUTPUT,
         agent=anomaly_detector,
     )
     
-    # Create the Crew
-    crew = Crew(
-        agents=[spending_analyst, budget_advisor, anomaly_detector],
-        tasks=[spending_analysis_task, budget_advice_task, anomaly_detection_task],
+    # Create the Crews
+    budget_crew = Crew(
+        agents=[spending_analyst, budget_advisor],
+        tasks=[spending_analysis_task, budget_advice_task],
         process=Process.sequential,
         verbose=True,
     )
     
-    return crew
+    anomaly_crew = Crew(
+        agents=[anomaly_detector],
+        tasks=[anomaly_detection_task],
+        process=Process.sequential,
+        verbose=True,
+    )
+    
+    return budget_crew, anomaly_crew
+
+
+async def _kickoff_all(crews):
+    """Kick off all crews concurrently and wait for every result."""
+    return await asyncio.gather(*(crew.kickoff_async() for crew in crews))
 
 
 def run_analysis():
-    """Run the analysis crew and return results."""
-    crew = create_analysis_crew()
-    result = crew.kickoff()
-    return result
+    """Run the analysis crews concurrently and return the combined results."""
+    crews = create_analysis_crews()
+    results = asyncio.run(_kickoff_all(crews))
+    return "\n\n".join(str(result) for result in results)
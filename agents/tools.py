@@ -3,9 +3,16 @@ Custom tools for CrewAI agents to query transaction data.
 """
 
 import sys
+import time
+import hashlib
+import json
+from functools import lru_cache
 from pathlib import Path
-from typing import Type
+from typing import Optional, Type
+import numpy as np
+import pandas as pd
 from crewai.tools import BaseTool
+from postgrest.exceptions import APIError
 from pydantic import BaseModel, Field
 
 # Add parent to path for gmail_fetcher import
@@ -16,6 +23,204 @@ load_dotenv()
 
 from gmail_fetcher import get_supabase_client
 
+# How long the shared debit snapshot is reused before re-fetching
+SNAPSHOT_TTL_SECONDS = 300
+
+SNAPSHOT_COLUMNS = ["id", "transaction_date", "description", "amount", "category"]
+
+# Rows per snapshot request (PostgREST returns at most 1000 per request)
+SNAPSHOT_PAGE_SIZE = 1000
+
+# PostgREST error for an RPC call to a function that does not exist
+FUNCTION_NOT_FOUND = "PGRST202"
+
+format_amount = "${:,.2f}".format
+
+
+@lru_cache(maxsize=1)
+def _load_debit_snapshot(ttl_bucket: int) -> pd.DataFrame:
+    """Fetch all debit transactions. ttl_bucket only exists to expire the cache."""
+    client = get_supabase_client()
+    rows = []
+    while True:
+        result = (
+            client.table("transactions")
+            .select(", ".join(SNAPSHOT_COLUMNS))
+            .eq("transaction_type", "debit")
+            .order("transaction_date")
+            .order("id")
+            .range(len(rows), len(rows) + SNAPSHOT_PAGE_SIZE - 1)
+            .execute()
+        )
+        rows.extend(result.data)
+        if len(result.data) < SNAPSHOT_PAGE_SIZE:
+            break
+    df = pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+    df["amount"] = df["amount"].astype(np.float64)
+    return df
+
+
+def _get_debit_snapshot() -> pd.DataFrame:
+    """
+    Get debit transactions, fetched once and shared by all tools.
+    
+    A single analysis run calls several tools; they all read the same
+    snapshot instead of each scanning the table. The snapshot is refreshed
+    after SNAPSHOT_TTL_SECONDS. Treat it as read-only.
+    """
+    return _load_debit_snapshot(int(time.monotonic() // SNAPSHOT_TTL_SECONDS))
+
+
+def dataset_fingerprint() -> str:
+    """
+    Hash the debit transactions so callers can cache results per dataset.
+    
+    Computed in Postgres via the debit_fingerprint() function
+    (sql/functions.sql), falling back to hashing the shared debit snapshot
+    in Python if the function is not installed.
+    
+    Returns:
+        SHA-256 hex digest that changes whenever any debit row changes
+    """
+    rows = _call_rpc(get_supabase_client(), "debit_fingerprint")
+    if rows is not None:
+        payload = json.dumps(rows, sort_keys=True, default=str)
+    else:
+        df = _get_debit_snapshot()
+        payload = df.sort_values("id").to_json(orient="records")
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _call_rpc(client, function: str) -> Optional[list]:
+    """
+    Call a database function from sql/functions.sql.
+    
+    Returns:
+        The function's rows, or None if it is not installed; any other
+        error (timeout, auth, ...) is raised rather than hidden
+    """
+    try:
+        return client.rpc(function).execute().data
+    except APIError as e:
+        if e.code != FUNCTION_NOT_FOUND:
+            raise
+        return None
+
+
+def _large_reason(ratio: Optional[float]) -> str:
+    """Describe an unusually large amount by its ratio to the median."""
+    if ratio is None:
+        return "Amount is far above median"
+    return f"Amount is {ratio:.1f}x median"
+
+
+def _get_category_totals(client) -> list:
+    """
+    Get debit spending per category, largest first.
+    
+    Aggregates in Postgres via the category_spending() function
+    (sql/functions.sql), falling back to summing the shared debit snapshot
+    in Python if the function is not installed.
+    
+    Returns:
+        List of (category, total) tuples
+    """
+    rows = _call_rpc(client, "category_spending")
+    if rows is not None:
+        return [(row["category"], float(row["total"])) for row in rows]
+    
+    df = _get_debit_snapshot()
+    categories = df["category"].fillna("").replace("", "Uncategorized")
+    totals = df["amount"].groupby(categories).sum().sort_values(ascending=False)
+    return [(cat, float(amount)) for cat, amount in totals.items()]
+
+
+def _get_monthly_totals(client) -> list:
+    """
+    Get debit spending per month (YYYY-MM), oldest first.
+    
+    Aggregates in Postgres via the monthly_spending() function
+    (sql/functions.sql), falling back to summing the shared debit snapshot
+    in Python if the function is not installed.
+    
+    Returns:
+        List of (month, total) tuples
+    """
+    rows = _call_rpc(client, "monthly_spending")
+    if rows is not None:
+        return [(row["month"], float(row["total"])) for row in rows]
+    
+    df = _get_debit_snapshot()
+    months = df["transaction_date"].str.slice(0, 7)
+    totals = df["amount"].groupby(months).sum()
+    return [(month, float(amount)) for month, amount in totals.items()]
+
+
+def _get_anomalies(client) -> list:
+    """
+    Find potential duplicates and unusually large debit transactions.
+    
+    Runs in Postgres via the detect_anomalies() function (sql/functions.sql),
+    falling back to scanning the shared debit snapshot in Python if the
+    function is not installed.
+    
+    Returns:
+        List of dicts with "type", "transaction" and "reason" keys
+    """
+    rows = _call_rpc(client, "detect_anomalies")
+    if rows is not None:
+        return [
+            {
+                "type": row["kind"],
+                "transaction": row,
+                "reason": (
+                    "Same as another transaction"
+                    if row["kind"] == "Potential Duplicate"
+                    # ratio is NULL when the median is 0
+                    else _large_reason(None if row["ratio"] is None else float(row["ratio"]))
+                ),
+            }
+            for row in rows
+        ]
+    
+    df = _get_debit_snapshot()
+    if df.empty:
+        return []
+    
+    amounts = df["amount"].to_numpy(dtype=np.float64)
+    median_amount = np.median(amounts)
+    mad = np.median(np.abs(amounts - median_amount))
+    # Median + 5 MADs is robust to the very outliers we're looking for; when
+    # most amounts are identical (MAD of 0) fall back to 3x the mean
+    large_threshold = median_amount + 5 * mad if mad > 0 else amounts.mean() * 3
+    
+    # Check for duplicates (every repeat after the first occurrence)
+    duplicate_mask = (
+        df.assign(description_key=df["description"].str.slice(0, 30))
+        .duplicated(subset=["transaction_date", "description_key", "amount"])
+        .to_numpy()
+    )
+    anomalies = [
+        {
+            "type": "Potential Duplicate",
+            "transaction": tx,
+            "reason": "Same as another transaction",
+        }
+        for tx in df[duplicate_mask].to_dict("records")
+    ]
+    
+    # Check for unusually large
+    anomalies.extend(
+        {
+            "type": "Unusually Large",
+            "transaction": tx,
+            "reason": _large_reason(tx["amount"] / median_amount if median_amount else None),
+        }
+        for tx in df[amounts > large_threshold].to_dict("records")
+    )
+    
+    return anomalies
+
 
 class QueryTransactionsInput(BaseModel):
     """Input for QueryTransactionsTool."""
@@ -48,12 +253,15 @@ class QueryTransactionsTool(BaseTool):
             if not transactions:
                 return "No transactions found in the database."
             
-            output = f"Found {len(transactions)} transactions:\n\n"
-            for tx in transactions:
-                tx_type = "+" if tx["transaction_type"] == "credit" else "-"
-                output += f"- {tx['transaction_date']}: {tx_type}${tx['amount']:.2f} | {tx['category']} | {tx['description'][:50]}\n"
+            parts = [f"Found {len(transactions)} transactions:\n"]
+            parts.extend(
+                f"- {tx['transaction_date']}: "
+                f"{'+' if tx['transaction_type'] == 'credit' else '-'}${tx['amount']:.2f} | "
+                f"{tx['category']} | {tx['description'][:50]}"
+                for tx in transactions
+            )
             
-            return output
+            return "\n".join(parts)
             
         except Exception as e:
             return f"Error querying transactions: {str(e)}"
@@ -78,31 +286,19 @@ class GetCategoryStatsTool(BaseTool):
         """Get category statistics from Supabase."""
         try:
             client = get_supabase_client()
-            result = (
-                client.table("transactions")
-                .select("category, amount, transaction_type")
-                .eq("transaction_type", "debit")
-                .execute()
-            )
-            
-            transactions = result.data
-            if not transactions:
+            sorted_cats = _get_category_totals(client)
+            if not sorted_cats:
                 return "No debit transactions found."
             
-            category_totals = {}
-            for tx in transactions:
-                cat = tx["category"] or "Uncategorized"
-                category_totals[cat] = category_totals.get(cat, 0) + float(tx["amount"])
-            
-            sorted_cats = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)
-            total = sum(category_totals.values())
+            total = sum(amount for _, amount in sorted_cats)
             
-            output = f"Total spending: ${total:,.2f}\n\nBreakdown by category:\n"
-            for cat, amount in sorted_cats:
-                pct = (amount / total) * 100 if total > 0 else 0
-                output += f"- {cat}: ${amount:,.2f} ({pct:.1f}%)\n"
+            parts = [f"Total spending: {format_amount(total)}\n", "Breakdown by category:"]
+            parts.extend(
+                f"- {cat}: {format_amount(amount)} ({(amount / total) * 100 if total > 0 else 0:.1f}%)"
+                for cat, amount in sorted_cats
+            )
             
-            return output
+            return "\n".join(parts)
             
         except Exception as e:
             return f"Error getting category stats: {str(e)}"
@@ -122,43 +318,26 @@ class GetMonthlyTrendsTool(BaseTool):
         """Get monthly trends from Supabase."""
         try:
             client = get_supabase_client()
-            result = (
-                client.table("transactions")
-                .select("transaction_date, amount, transaction_type")
-                .eq("transaction_type", "debit")
-                .order("transaction_date")
-                .execute()
-            )
-            
-            transactions = result.data
-            if not transactions:
+            sorted_months = _get_monthly_totals(client)
+            if not sorted_months:
                 return "No debit transactions found."
             
-            monthly_totals = {}
-            for tx in transactions:
-                month = tx["transaction_date"][:7]
-                monthly_totals[month] = monthly_totals.get(month, 0) + float(tx["amount"])
-            
-            sorted_months = sorted(monthly_totals.items())
-            
-            output = "Monthly spending trends:\n\n"
+            parts = ["Monthly spending trends:\n"]
             prev_amount = None
             for month, amount in sorted_months:
                 if prev_amount is not None:
                     change = amount - prev_amount
-                    change_str = f" (↑${change:,.2f})" if change > 0 else f" (↓${abs(change):,.2f})" if change < 0 else " (→)"
+                    change_str = f" (↑{format_amount(change)})" if change > 0 else f" (↓{format_amount(abs(change))})" if change < 0 else " (→)"
                 else:
                     change_str = ""
-                output += f"- {month}: ${amount:,.2f}{change_str}\n"
+                parts.append(f"- {month}: {format_amount(amount)}{change_str}")
                 prev_amount = amount
             
             if len(sorted_months) >= 2:
-                first = sorted_months[0][1]
-                last = sorted_months[-1][1]
                 avg = sum(m[1] for m in sorted_months) / len(sorted_months)
-                output += f"\nAverage monthly spending: ${avg:,.2f}"
+                parts.append(f"\nAverage monthly spending: {format_amount(avg)}")
             
-            return output
+            return "\n".join(parts)
             
         except Exception as e:
             return f"Error getting monthly trends: {str(e)}"
@@ -177,64 +356,39 @@ class DetectAnomaliesTool(BaseTool):
         """Detect anomalies in transactions."""
         try:
             client = get_supabase_client()
-            result = (
-                client.table("transactions")
-                .select("id, transaction_date, description, amount, category, transaction_type")
-                .eq("transaction_type", "debit")
-                .execute()
-            )
-            
-            transactions = result.data
-            if not transactions:
-                return "No debit transactions found."
-            
-            anomalies = []
-            amounts = [float(tx["amount"]) for tx in transactions]
-            avg_amount = sum(amounts) / len(amounts)
-            large_threshold = avg_amount * 3
-            
-            # Check for duplicates
-            seen = {}
-            for tx in transactions:
-                key = f"{tx['transaction_date']}_{tx['description'][:30]}_{tx['amount']}"
-                if key in seen:
-                    anomalies.append({
-                        "type": "Potential Duplicate",
-                        "transaction": tx,
-                        "reason": f"Same as another transaction"
-                    })
-                seen[key] = tx
-            
-            # Check for unusually large
-            for tx in transactions:
-                if float(tx["amount"]) > large_threshold:
-                    anomalies.append({
-                        "type": "Unusually Large",
-                        "transaction": tx,
-                        "reason": f"Amount is {float(tx['amount'])/avg_amount:.1f}x average"
-                    })
+            anomalies = _get_anomalies(client)
             
             if not anomalies:
                 return "No anomalies detected. All transactions appear normal."
             
-            output = f"Found {len(anomalies)} potential anomalies:\n\n"
-            output += "| Date | Description | Amount | Type | Reason |\n"
-            output += "| --- | --- | --- | --- | --- |\n"
-            for a in anomalies:
-                tx = a["transaction"]
-                output += f"| {tx['transaction_date']} | {tx['description'][:35]} | ${float(tx['amount']):,.2f} | {a['type']} | {a['reason']} |\n"
+            parts = [
+                f"Found {len(anomalies)} potential anomalies:\n",
+                "| Date | Description | Amount | Type | Reason |",
+                "| --- | --- | --- | --- | --- |",
+            ]
+            parts.extend(
+                f"| {a['transaction']['transaction_date']} | {a['transaction']['description'][:35]} | "
+                f"{format_amount(float(a['transaction']['amount']))} | {a['type']} | {a['reason']} |"
+                for a in anomalies
+            )
             
-            return output
+            return "\n".join(parts)
             
         except Exception as e:
             return f"Error detecting anomalies: {str(e)}"
 
 
 def get_analysis_tools():
-    """Return list of all analysis tools."""
-    return [
+    """
+    Return list of all analysis tools, sorted by name.
+    
+    The order is part of every agent prompt; keeping it stable keeps the
+    prompt prefix identical across runs so Ollama can reuse its KV-cache.
+    """
+    tools = [
         QueryTransactionsTool(),
         GetCategoryStatsTool(),
         GetMonthlyTrendsTool(),
         DetectAnomaliesTool(),
     ]
+    return sorted(tools, key=lambda tool: tool.name)
@@ -3,26 +3,62 @@
 Analyze Spending - Run CrewAI agents to analyze transactions.
 
 Usage:
-    python analyze_spending.py
+    python analyze_spending.py              # Reuse cached analysis if data is unchanged
+    python analyze_spending.py --refresh    # Always re-run the agents
 
 This script runs a crew of AI agents that:
 1. Analyze spending patterns and trends
 2. Provide budget recommendations
 3. Detect unusual transactions or duplicates
 
-Results are saved to a JSON file for dashboard display.
+Results are saved to a JSON file for dashboard display. Each analysis is also
+cached under .analysis_cache/ keyed by a hash of the debit transactions, the
+model and the agent prompts, so re-running on unchanged data skips the agents
+entirely.
 """
 
 import os
+import sys
 import json
+import hashlib
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-from agents.crew import run_analysis
+from agents.crew import analysis_fingerprint, run_analysis
+from agents.tools import dataset_fingerprint
+
+# Cached analyses, one JSON file per cache key (see analysis_cache_key)
+CACHE_DIR = Path(__file__).parent / ".analysis_cache"
+
+
+def analysis_cache_key() -> str:
+    """Hash the dataset fingerprint together with the model and prompts."""
+    key = f"{dataset_fingerprint()}:{analysis_fingerprint()}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def load_cached_analysis(dataset_hash: str) -> Optional[str]:
+    """Return the cached analysis for this dataset hash, if any."""
+    cache_file = CACHE_DIR / f"{dataset_hash}.json"
+    if not cache_file.exists():
+        return None
+    with open(cache_file) as f:
+        return json.load(f)["analysis"]
+
+
+def save_cached_analysis(dataset_hash: str, analysis: str) -> None:
+    """Cache an analysis atomically (write to a temp file, then rename)."""
+    CACHE_DIR.mkdir(exist_ok=True)
+    cache_file = CACHE_DIR / f"{dataset_hash}.json"
+    tmp_file = cache_file.with_suffix(".json.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump({"analysis": analysis}, f)
+    os.replace(tmp_file, cache_file)
 
 
 def main():
@@ -41,8 +77,16 @@ def main():
     print()
     
     try:
-        # Run the analysis crew
-        result = run_analysis()
+        # Reuse a previous analysis if the data, model and prompts haven't changed
+        dataset_hash = analysis_cache_key()
+        result = None if "--refresh" in sys.argv else load_cached_analysis(dataset_hash)
+        
+        if result is not None:
+            print(f"✓ Data and prompts unchanged since last analysis ({dataset_hash[:12]}), using cached result")
+        else:
+            # Run the analysis crew
+            result = str(run_analysis())
+            save_cached_analysis(dataset_hash, result)
         
         print()
         print("=" * 60)
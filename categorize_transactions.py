@@ -9,13 +9,28 @@ This script:
 1. Fetches transactions with category=NULL from Supabase
 2. Uses Ollama (llama3.2) to categorize each transaction
 3. Updates the transaction record with the assigned category
+
+Categories are cached by normalized description (in memory and in a local
+SQLite file), so recurring merchants only hit Ollama once. Well-known
+merchants are matched by regex RULES without touching Ollama. Cache misses are
+sent to Ollama concurrently, bounded by OLLAMA_CONCURRENCY.
+
+Cache misses are first classified by embedding similarity against per-category
+centroids (OLLAMA_EMBED_MODEL); full LLM generation is only used when no
+category is similar enough or the embedding model is unavailable.
 """
 
 import os
+import re
 import json
-import requests
+import asyncio
+import sqlite3
+import httpx
+import numpy as np
+from pathlib import Path
 from typing import Optional
 from dotenv import load_dotenv
+from postgrest.exceptions import APIError
 
 # Load environment variables
 load_dotenv()
@@ -25,6 +40,30 @@ from gmail_fetcher import get_supabase_client
 # Ollama configuration
 OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
+OLLAMA_CONCURRENCY = int(os.getenv("OLLAMA_CONCURRENCY", "4"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_MAX_RETRIES = 3
+RETRY_STATUS_CODES = {429, 503}
+
+# Keep idle connections open between pages (httpx defaults to 5s expiry)
+OLLAMA_LIMITS = httpx.Limits(
+    max_keepalive_connections=OLLAMA_CONCURRENCY + 1,
+    keepalive_expiry=60,
+)
+
+# Embedding classifier configuration
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBEDDING_MIN_SIMILARITY = 0.4  # Below this, fall back to LLM generation
+
+# Rows per fetched page and per batched category write
+PAGE_SIZE = 1000
+UPDATE_BATCH_SIZE = 500
+
+# PostgREST error for an RPC call to a function that does not exist
+FUNCTION_NOT_FOUND = "PGRST202"
+
+# Category cache (persists across runs)
+CATEGORY_CACHE_DB = Path(os.getenv("CATEGORY_CACHE_DB", Path(__file__).parent / "category_cache.db"))
 
 # Valid categories
 VALID_CATEGORIES = [
@@ -41,6 +80,41 @@ VALID_CATEGORIES = [
     "Other",
 ]
 
+# Single-pass validation of LLM responses against VALID_CATEGORIES
+_CATEGORY_RE = re.compile("|".join(re.escape(c) for c in VALID_CATEGORIES), re.IGNORECASE)
+_CATEGORY_BY_LOWER = {c.lower(): c for c in VALID_CATEGORIES}
+
+# Exemplars embedded alongside each category label to build its centroid
+CATEGORY_EXEMPLARS = {
+    "Shopping": ["Amazon", "Walmart", "Target", "retail store"],
+    "Food & Dining": ["restaurant", "food delivery", "grocery store"],
+    "Transportation": ["Uber", "Lyft", "gas station", "parking"],
+    "Subscriptions": ["Netflix", "Spotify", "cloud services", "software subscription"],
+    "Utilities": ["phone bill", "internet provider", "electricity"],
+    "Housing": ["rent", "mortgage", "home services"],
+    "Entertainment": ["movies", "video games", "event tickets", "hobbies"],
+    "Travel": ["hotel", "airline flight", "travel booking"],
+    "Healthcare": ["medical clinic", "pharmacy", "health insurance"],
+    "Income": ["refund", "cashback", "payment received"],
+    "Other": ["miscellaneous"],
+}
+
+# Deterministic merchant rules, checked in order before any Ollama call
+RULES = [
+    # \W* also covers the "UBER *EATS" / "UBER* EATS" forms used on card statements
+    (re.compile(r"\b(UBER\W*EATS|DOORDASH|GRUBHUB|STARBUCKS|MCDONALD|CHIPOTLE|DOMINO)", re.I), "Food & Dining"),
+    (re.compile(r"\b(NETFLIX|SPOTIFY|HULU|DISNEY\s*(\+|PLUS)|PRIME VIDEO|YOUTUBE ?PREMIUM)", re.I), "Subscriptions"),
+    # Cloud services are Subscriptions (see SYSTEM_PROMPT); must precede the AMAZON rule
+    (re.compile(r"\b(AMAZON\s*WEB\s*SERVICES|AWS)\b", re.I), "Subscriptions"),
+    (re.compile(r"\b(UBER|LYFT|SHELL|CHEVRON|EXXON|SMARTRIP|PARKING)\b", re.I), "Transportation"),
+    (re.compile(r"\b(VERIZON|AT&T|T-MOBILE|MINT MOBILE|COMCAST|XFINITY)\b", re.I), "Utilities"),
+    # Bare DELTA would also catch e.g. DELTA DENTAL
+    (re.compile(r"\b(DELTA\s*(AIR\w*|\.COM)|UNITED AIRLINES|AMERICAN AIRLINES|AIRBNB|EXPEDIA|MARRIOTT|HILTON)\b", re.I), "Travel"),
+    (re.compile(r"\b(AMAZON|AMZN|WALMART|TARGET|BEST BUY|COSTCO)\b", re.I), "Shopping"),
+    (re.compile(r"\b(CVS|WALGREENS|PHARMACY)\b", re.I), "Healthcare"),
+    (re.compile(r"\b(CASHBACK|REFUND)\b", re.I), "Income"),
+]
+
 SYSTEM_PROMPT = """You are a transaction categorizer. Given a credit card transaction description, respond with ONLY the category name from this list:
 - Shopping (retail: Amazon, Walmart, Target, etc.)
 - Food & Dining (restaurants, food delivery, groceries)
@@ -56,31 +130,223 @@ SYSTEM_PROMPT = """You are a transaction categorizer. Given a credit card transa
 
 Respond with ONLY the category name, nothing else."""
 
+_DIGITS_RE = re.compile(r"\d+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# In-process cache: normalized description -> category
+_category_cache = {}
+_cache_db = None
+
+
+def normalize_description(description: str) -> str:
+    """Normalize a description for cache lookups (uppercase, no digits, collapsed whitespace)."""
+    normalized = _DIGITS_RE.sub(" ", description.upper())
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+def match_rule(description: str) -> Optional[str]:
+    """
+    Return the category of the first matching RULES entry, or None.
+    
+    Rule hits skip the LLM and are never re-checked, so every rule change
+    should keep these passing (python -m doctest categorize_transactions.py):
+    
+    >>> match_rule("UBER *EATS")
+    'Food & Dining'
+    >>> match_rule("UBER* EATS PENDING")
+    'Food & Dining'
+    >>> match_rule("UBER *TRIP")
+    'Transportation'
+    >>> match_rule("DELTA AIR LINES ATLANTA")
+    'Travel'
+    >>> match_rule("DELTA DELTA.COM")
+    'Travel'
+    >>> match_rule("DELTA DENTAL") is None
+    True
+    >>> match_rule("AMAZON WEB SERVICES AWS.AMAZON.CO")
+    'Subscriptions'
+    >>> match_rule("AMAZON MKTPL*2K4")
+    'Shopping'
+    >>> match_rule("DISNEY+")
+    'Subscriptions'
+    >>> match_rule("DISNEY PLUS")
+    'Subscriptions'
+    """
+    for pattern, category in RULES:
+        if pattern.search(description):
+            return category
+    return None
+
+
+def _get_cache_db() -> sqlite3.Connection:
+    """Open (once) the SQLite category cache, creating the table if needed."""
+    global _cache_db
+    if _cache_db is None:
+        _cache_db = sqlite3.connect(CATEGORY_CACHE_DB)
+        _cache_db.execute(
+            "CREATE TABLE IF NOT EXISTS category_cache (norm_desc TEXT PRIMARY KEY, category TEXT)"
+        )
+    return _cache_db
+
+
+def get_cached_category(norm_desc: str) -> Optional[str]:
+    """Look up a category in the in-memory cache, then the SQLite cache."""
+    category = _category_cache.get(norm_desc)
+    if category is None:
+        row = _get_cache_db().execute(
+            "SELECT category FROM category_cache WHERE norm_desc = ?", (norm_desc,)
+        ).fetchone()
+        if row:
+            category = _category_cache[norm_desc] = row[0]
+    return category
+
+
+def store_cached_category(norm_desc: str, category: str) -> None:
+    """Store a category in both cache layers."""
+    _category_cache[norm_desc] = category
+    db = _get_cache_db()
+    db.execute(
+        "INSERT OR REPLACE INTO category_cache (norm_desc, category) VALUES (?, ?)",
+        (norm_desc, category),
+    )
+    db.commit()
+
+
+async def _embed(http: httpx.AsyncClient, text: str) -> Optional[np.ndarray]:
+    """Embed text with OLLAMA_EMBED_MODEL, returning a unit vector or None if failed."""
+    response = await http.post(
+        "/api/embeddings",
+        json={"model": OLLAMA_EMBED_MODEL, "prompt": text},
+    )
+    if response.status_code != 200:
+        return None
+    
+    vector = np.asarray(response.json().get("embedding", []), dtype=np.float64)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
 
-def categorize_with_ollama(description: str) -> Optional[str]:
+async def build_category_centroids(http: httpx.AsyncClient) -> Optional[np.ndarray]:
+    """
+    Embed each category label with its exemplars and average them.
+    
+    Args:
+        http: Async HTTP client bound to OLLAMA_URL
+        
+    Returns:
+        Matrix of unit-norm centroids (one row per VALID_CATEGORIES entry),
+        or None if the embedding model is unavailable
+    """
+    try:
+        centroids = []
+        for category in VALID_CATEGORIES:
+            texts = [category, *CATEGORY_EXEMPLARS[category]]
+            vectors = await asyncio.gather(*(_embed(http, text) for text in texts))
+            if any(vector is None for vector in vectors):
+                return None
+            centroid = np.mean(vectors, axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+        return np.vstack(centroids)
+    except httpx.HTTPError:
+        return None
+
+
+async def _classify_by_embedding(
+    http: httpx.AsyncClient,
+    centroids: np.ndarray,
+    description: str,
+) -> Optional[str]:
+    """Pick the most similar category centroid, or None if none is similar enough."""
+    try:
+        vector = await _embed(http, description)
+    except httpx.HTTPError:
+        return None
+    if vector is None:
+        return None
+    
+    similarities = centroids @ vector
+    best = int(np.argmax(similarities))
+    if similarities[best] < EMBEDDING_MIN_SIMILARITY:
+        return None
+    return VALID_CATEGORIES[best]
+
+
+async def categorize_with_ollama(
+    http: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    description: str,
+    centroids: Optional[np.ndarray] = None,
+) -> Optional[str]:
+    """
+    Categorize a transaction description, using the cache before Ollama.
+    
+    Rule and cache hits return immediately without waiting on the semaphore. Misses
+    are classified by embedding similarity when centroids are available,
+    falling back to LLM generation. Only successful categorizations are
+    cached, so Ollama errors are retried on the next run.
+    
+    Args:
+        http: Async HTTP client bound to OLLAMA_URL
+        semaphore: Limits the number of in-flight Ollama requests
+        description: Transaction description text
+        centroids: Category centroids from build_category_centroids()
+        
+    Returns:
+        Category string or None if failed
+    """
+    category = match_rule(description)
+    if category:
+        return category
+    
+    norm_desc = normalize_description(description)
+    category = get_cached_category(norm_desc)
+    if category:
+        return category
+    
+    async with semaphore:
+        if centroids is not None:
+            category = await _classify_by_embedding(http, centroids, description)
+        if not category:
+            category = await _generate_category(http, description)
+    
+    if category:
+        store_cached_category(norm_desc, category)
+    return category
+
+
+async def _generate_category(http: httpx.AsyncClient, description: str) -> Optional[str]:
     """
     Use Ollama to categorize a transaction description.
     
+    Retries with exponential backoff when Ollama is overloaded (429/503).
+    
     Args:
+        http: Async HTTP client bound to OLLAMA_URL
         description: Transaction description text
         
     Returns:
         Category string or None if failed
     """
     try:
-        response = requests.post(
-            f"{OLLAMA_URL}/api/generate",
-            json={
-                "model": OLLAMA_MODEL,
-                "prompt": f"{SYSTEM_PROMPT}\n\nTransaction: {description}\nCategory:",
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Low temperature for consistent results
-                    "num_predict": 20,   # Short response
-                }
-            },
-            timeout=30,
-        )
+        for attempt in range(OLLAMA_MAX_RETRIES + 1):
+            response = await http.post(
+                "/api/generate",
+                json={
+                    "model": OLLAMA_MODEL,
+                    # Identical system prompt on every call lets Ollama reuse its KV-cache prefix
+                    "system": SYSTEM_PROMPT,
+                    "prompt": f"Transaction: {description}\nCategory:",
+                    "stream": False,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                    "options": {
+                        "temperature": 0.1,  # Low temperature for consistent results
+                        "num_predict": 20,   # Short response
+                    }
+                },
+            )
+            if response.status_code not in RETRY_STATUS_CODES or attempt == OLLAMA_MAX_RETRIES:
+                break
+            await asyncio.sleep(2 ** attempt)  # 1s, 2s, 4s
         
         if response.status_code != 200:
             print(f"  ✗ Ollama error: {response.status_code}")
@@ -89,15 +355,11 @@ def categorize_with_ollama(description: str) -> Optional[str]:
         result = response.json()
         category = result.get("response", "").strip()
         
-        # Validate category
-        for valid_cat in VALID_CATEGORIES:
-            if valid_cat.lower() in category.lower():
-                return valid_cat
-        
-        # Fallback to Other if no match
-        return "Other"
+        # Validate category (fallback to Other if no match)
+        match = _CATEGORY_RE.search(category)
+        return _CATEGORY_BY_LOWER[match.group(0).lower()] if match else "Other"
         
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("  ✗ Could not connect to Ollama. Is it running?")
         return None
     except Exception as e:
@@ -105,15 +367,141 @@ def categorize_with_ollama(description: str) -> Optional[str]:
         return None
 
 
-def get_uncategorized_transactions(client) -> list:
-    """Fetch transactions without a category."""
-    result = (
+async def warm_up_model(http: httpx.AsyncClient) -> None:
+    """Load OLLAMA_MODEL and keep it resident for OLLAMA_KEEP_ALIVE (no generation)."""
+    try:
+        await http.post(
+            "/api/generate",
+            json={"model": OLLAMA_MODEL, "keep_alive": OLLAMA_KEEP_ALIVE},
+            timeout=120,
+        )
+    except httpx.HTTPError:
+        pass
+
+
+async def categorize_all(
+    http: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    centroids: Optional[np.ndarray],
+    transactions: list,
+) -> list:
+    """
+    Categorize transactions concurrently.
+    
+    Transactions sharing a normalized description are categorized once.
+    
+    Args:
+        http: Async HTTP client bound to OLLAMA_URL
+        semaphore: Limits the number of in-flight Ollama requests
+        centroids: Category centroids from build_category_centroids()
+        transactions: Transaction records from Supabase
+        
+    Returns:
+        List of (transaction, category) tuples for successful categorizations
+    """
+    groups = {}
+    for tx in transactions:
+        description = tx.get("description", "Unknown")
+        groups.setdefault(normalize_description(description), []).append(tx)
+    
+    results = []
+    
+    async def categorize_group(group: list) -> None:
+        description = group[0].get("description", "Unknown")
+        category = await categorize_with_ollama(http, semaphore, description, centroids)
+        
+        # Truncate long descriptions for display
+        display_desc = description[:50] + "..." if len(description) > 50 else description
+        count_str = f" (x{len(group)})" if len(group) > 1 else ""
+        
+        if category:
+            print(f"  {display_desc}{count_str} → {category}")
+            results.extend((tx, category) for tx in group)
+        else:
+            print(f"  {display_desc}{count_str} → Skipped (Ollama error)")
+    
+    await asyncio.gather(*(categorize_group(group) for group in groups.values()))
+    return results
+
+
+async def categorize_uncategorized(client) -> tuple:
+    """
+    Categorize all uncategorized transactions, one page at a time.
+    
+    The next page is fetched in the background while the current one is
+    being categorized, so memory stays bounded by PAGE_SIZE and Ollama starts
+    working as soon as the first page arrives. The model is only loaded, and
+    the category centroids only built, once that page turns out non-empty.
+    
+    Args:
+        client: Supabase client
+        
+    Returns:
+        Tuple of (transactions categorized, transactions seen)
+    """
+    semaphore = asyncio.Semaphore(OLLAMA_CONCURRENCY)
+    success_count = 0
+    total_count = 0
+    
+    page = await asyncio.to_thread(get_uncategorized_transactions, client)
+    if not page:
+        return success_count, total_count
+    
+    async with httpx.AsyncClient(base_url=OLLAMA_URL, timeout=30, limits=OLLAMA_LIMITS) as http:
+        model_loading = asyncio.create_task(warm_up_model(http))
+        centroids = await build_category_centroids(http)
+        await model_loading
+        if centroids is not None:
+            print(f"✓ Using embedding classifier ({OLLAMA_EMBED_MODEL})")
+        else:
+            print(f"⚠ Embedding model {OLLAMA_EMBED_MODEL} unavailable, using LLM generation only")
+        print()
+        
+        page_number = 1
+        
+        while page:
+            # Prefetch the next page while this one is categorized
+            next_page = None
+            if len(page) == PAGE_SIZE:
+                next_page = asyncio.create_task(
+                    asyncio.to_thread(get_uncategorized_transactions, client, page[-1]["id"])
+                )
+            
+            print(f"Page {page_number}: {len(page)} uncategorized transaction(s)")
+            categorized = await categorize_all(http, semaphore, centroids, page)
+            success_count += await asyncio.to_thread(update_transaction_categories, client, categorized)
+            total_count += len(page)
+            
+            page = await next_page if next_page else []
+            page_number += 1
+    
+    return success_count, total_count
+
+
+def get_uncategorized_transactions(client, after_id: Optional[str] = None) -> list:
+    """
+    Fetch one page of transactions without a category.
+    
+    Uses keyset pagination on id, so rows categorized in earlier pages
+    don't shift later pages the way offsets would.
+    
+    Args:
+        client: Supabase client
+        after_id: Only return transactions with an id greater than this
+        
+    Returns:
+        Up to PAGE_SIZE transaction records, ordered by id
+    """
+    query = (
         client.table("transactions")
-        .select("*")
+        .select("id, description")
         .is_("category", "null")
-        .execute()
+        .order("id")
+        .limit(PAGE_SIZE)
     )
-    return result.data
+    if after_id:
+        query = query.gt("id", after_id)
+    return query.execute().data
 
 
 def update_transaction_category(client, transaction_id: str, category: str) -> bool:
@@ -126,6 +514,43 @@ def update_transaction_category(client, transaction_id: str, category: str) -> b
         return False
 
 
+def update_transaction_categories(client, categorized: list) -> int:
+    """
+    Write categories back in batches of UPDATE_BATCH_SIZE rows.
+    
+    Each batch is one call to the update_categories_bulk() function
+    (sql/functions.sql), which updates only the category column, so N
+    updates cost ceil(N / UPDATE_BATCH_SIZE) round trips instead of N. If
+    the function is not installed, rows are updated one at a time.
+    
+    Args:
+        client: Supabase client
+        categorized: List of (transaction, category) tuples
+        
+    Returns:
+        Number of transactions updated
+    """
+    updated = 0
+    for start in range(0, len(categorized), UPDATE_BATCH_SIZE):
+        batch = categorized[start:start + UPDATE_BATCH_SIZE]
+        params = {
+            "ids": [tx["id"] for tx, _ in batch],
+            "cats": [category for _, category in batch],
+        }
+        try:
+            updated += client.rpc("update_categories_bulk", params).execute().data
+        except APIError as e:
+            if e.code != FUNCTION_NOT_FOUND:
+                print(f"  ✗ Database error: {e}")
+                continue
+            updated += sum(
+                update_transaction_category(client, tx["id"], category) for tx, category in batch
+            )
+        except Exception as e:
+            print(f"  ✗ Database error: {e}")
+    return updated
+
+
 def main():
     """Main entry point."""
     print("=" * 60)
@@ -136,12 +561,12 @@ def main():
     # Test Ollama connection
     print(f"Connecting to Ollama ({OLLAMA_URL})...")
     try:
-        test_resp = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
+        test_resp = httpx.get(f"{OLLAMA_URL}/api/tags", timeout=5)
         if test_resp.status_code != 200:
             print("✗ Could not connect to Ollama. Please ensure it's running.")
             return 1
         print(f"✓ Connected to Ollama (using model: {OLLAMA_MODEL})")
-    except requests.exceptions.ConnectionError:
+    except httpx.ConnectError:
         print("✗ Could not connect to Ollama. Please run: ollama serve")
         return 1
     
@@ -158,41 +583,18 @@ def main():
     
     print()
     
-    # Fetch uncategorized transactions
-    print("Fetching uncategorized transactions...")
-    transactions = get_uncategorized_transactions(client)
+    # Fetch and categorize uncategorized transactions page by page
+    print(f"Categorizing with up to {OLLAMA_CONCURRENCY} concurrent Ollama request(s)...")
+    success_count, total_count = asyncio.run(categorize_uncategorized(client))
     
-    if not transactions:
+    if not total_count:
         print("✓ All transactions are already categorized!")
         return 0
     
-    print(f"Found {len(transactions)} uncategorized transaction(s)")
-    print()
-    
-    # Categorize each transaction
-    success_count = 0
-    for i, tx in enumerate(transactions, 1):
-        description = tx.get("description", "Unknown")
-        tx_id = tx.get("id")
-        
-        # Truncate long descriptions for display
-        display_desc = description[:50] + "..." if len(description) > 50 else description
-        print(f"[{i}/{len(transactions)}] {display_desc}")
-        
-        # Get category from Ollama
-        category = categorize_with_ollama(description)
-        
-        if category:
-            print(f"  → {category}")
-            if update_transaction_category(client, tx_id, category):
-                success_count += 1
-        else:
-            print(f"  → Skipped (Ollama error)")
-    
     # Summary
     print()
     print("=" * 60)
-    print(f"✓ Categorized {success_count}/{len(transactions)} transactions")
+    print(f"✓ Categorized {success_count}/{total_count} transactions")
     print("=" * 60)
     
     return 0
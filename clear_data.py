@@ -8,12 +8,92 @@ This script:
 3. Truncates the statements table
 """
 
+import asyncio
+
 from dotenv import load_dotenv
 load_dotenv()
 
+from postgrest.types import ReturnMethod
+
 from gmail_fetcher import get_supabase_client
 from gmail_fetcher.config import STORAGE_BUCKET
 
+# Matches no real row; used to satisfy PostgREST's "DELETE needs a filter" rule
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+
+# Storage deletes: files per request and concurrent requests
+REMOVE_CHUNK_SIZE = 100
+REMOVE_CONCURRENCY = 8
+
+# Entries per storage list request (the SDK default is 100)
+LIST_PAGE_SIZE = 1000
+
+
+def list_files(client, folder: str) -> list:
+    """
+    List every file in a storage folder, paging through the listing.
+    
+    The whole listing is collected before anything is removed, so deletes
+    never shift the offsets of pages still to be read.
+    
+    Args:
+        client: Supabase client
+        folder: Folder within STORAGE_BUCKET
+        
+    Returns:
+        Paths of the files within STORAGE_BUCKET
+    """
+    bucket = client.storage.from_(STORAGE_BUCKET)
+    file_paths = []
+    offset = 0
+    while True:
+        files = bucket.list(folder, {"limit": LIST_PAGE_SIZE, "offset": offset})
+        file_paths.extend(f"{folder}/{f['name']}" for f in files)
+        if len(files) < LIST_PAGE_SIZE:
+            return file_paths
+        offset += LIST_PAGE_SIZE
+
+
+async def remove_files(client, file_paths: list) -> None:
+    """
+    Delete files from the storage bucket in concurrent chunks.
+    
+    Args:
+        client: Supabase client
+        file_paths: Paths within STORAGE_BUCKET
+    """
+    bucket = client.storage.from_(STORAGE_BUCKET)
+    semaphore = asyncio.Semaphore(REMOVE_CONCURRENCY)
+    
+    async def remove_chunk(chunk: list) -> None:
+        async with semaphore:
+            await asyncio.to_thread(bucket.remove, chunk)
+    
+    chunks = [
+        file_paths[i:i + REMOVE_CHUNK_SIZE]
+        for i in range(0, len(file_paths), REMOVE_CHUNK_SIZE)
+    ]
+    await asyncio.gather(*(remove_chunk(chunk) for chunk in chunks))
+
+
+def clear_table(client, table: str) -> bool:
+    """
+    Delete all rows from a table without returning them.
+    
+    Args:
+        client: Supabase client
+        table: Table name
+        
+    Returns:
+        False if the table was already empty, True otherwise
+    """
+    if not client.table(table).select("id").limit(1).execute().data:
+        return False
+    
+    # return=minimal: don't send the deleted rows back over the wire
+    client.table(table).delete(returning=ReturnMethod.minimal).neq("id", NIL_UUID).execute()
+    return True
+
 
 def main():
     print("=" * 60)
@@ -29,10 +109,9 @@ def main():
     print("Clearing storage bucket...")
     try:
         # List all files in the bucket
-        files = client.storage.from_(STORAGE_BUCKET).list("zolve")
-        if files:
-            file_paths = [f"zolve/{f['name']}" for f in files]
-            client.storage.from_(STORAGE_BUCKET).remove(file_paths)
+        file_paths = list_files(client, "zolve")
+        if file_paths:
+            asyncio.run(remove_files(client, file_paths))
             print(f"  ✓ Deleted {len(file_paths)} file(s) from storage")
         else:
             print("  ✓ Storage already empty")
@@ -42,17 +121,20 @@ def main():
     # 2. Clear transactions table
     print("Clearing transactions table...")
     try:
-        # Delete all records
-        result = client.table("transactions").delete().neq("id", "00000000-0000-0000-0000-000000000000").execute()
-        print(f"  ✓ Transactions table cleared")
+        if clear_table(client, "transactions"):
+            print(f"  ✓ Transactions table cleared")
+        else:
+            print(f"  ✓ Transactions table already empty")
     except Exception as e:
         print(f"  ⚠ Error: {e}")
     
     # 3. Clear statements table
     print("Clearing statements table...")
     try:
-        result = client.table("statements").delete().neq("id", "00000000-0000-0000-0000-000000000000").execute()
-        print(f"  ✓ Statements table cleared")
+        if clear_table(client, "statements"):
+            print(f"  ✓ Statements table cleared")
+        else:
+            print(f"  ✓ Statements table already empty")
     except Exception as e:
         print(f"  ⚠ Error: {e}")
     
@@ -24,7 +24,7 @@ def debug_supabase():
     print("STATEMENTS TABLE")
     print("=" * 60)
     
-    result = client.table("statements").select("*").limit(3).execute()
+    result = client.table("statements").select("id, filename, storage_path, status, email_date").limit(3).execute()
     statements = result.data
     
     print(f"Sample records (showing 3):\n")
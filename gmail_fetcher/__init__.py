@@ -7,8 +7,10 @@ from .supabase_client import (
     get_supabase_client,
     get_statements_by_status,
     update_status,
+    update_statuses,
     download_pdf,
     insert_transactions_batch,
+    insert_transaction_records,
 )
 
 __all__ = [
@@ -21,7 +23,9 @@ __all__ = [
     "get_supabase_client",
     "get_statements_by_status",
     "update_status",
+    "update_statuses",
     "download_pdf",
     "insert_transactions_batch",
+    "insert_transaction_records",
 ]
 
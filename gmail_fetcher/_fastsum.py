@@ -0,0 +1,26 @@
+"""Numba-compiled numeric kernels for transaction totals (optional, requires numba)."""
+
+import numba
+
+
+@numba.njit(cache=True, fastmath=True)
+def split_sum(amounts, is_credit):
+    """
+    Sum amounts into credit and debit totals in a single pass.
+    
+    Args:
+        amounts: 1-D NumPy array of amounts (e.g. int64 cents)
+        is_credit: 1-D NumPy bool array, True for credits
+        
+    Returns:
+        Tuple of (credit_total, debit_total)
+    """
+    credit_total = 0
+    debit_total = 0
+    for i in range(amounts.size):
+        value = amounts[i]
+        if is_credit[i]:
+            credit_total += value
+        else:
+            debit_total += value
+    return credit_total, debit_total
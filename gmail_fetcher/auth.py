@@ -1,5 +1,6 @@
 """Gmail API authentication module."""
 
+import json
 import os
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -8,6 +9,9 @@ from googleapiclient.discovery import build
 
 from .config import SCOPES, CREDENTIALS_FILE, TOKEN_FILE
 
+# Built services keyed by access token, so repeat calls skip rebuilding
+_service_cache = {}
+
 
 def get_gmail_service():
     """
@@ -23,7 +27,7 @@ def get_gmail_service():
     
     # Load existing token if available
     if TOKEN_FILE.exists():
-        creds = Credentials.from_authorized_user_file(str(TOKEN_FILE), SCOPES)
+        creds = Credentials.from_authorized_user_info(json.loads(TOKEN_FILE.read_bytes()), SCOPES)
     
     # If no valid credentials, authenticate
     if not creds or not creds.valid:
@@ -45,11 +49,18 @@ def get_gmail_service():
             )
             creds = flow.run_local_server(port=0)
         
-        # Save token for future runs
-        with open(TOKEN_FILE, "w") as token:
-            token.write(creds.to_json())
-            print(f"Token saved to {TOKEN_FILE}")
+        # Save token for future runs (atomically, so a crash can't truncate it)
+        tmp_file = TOKEN_FILE.with_suffix(".json.tmp")
+        tmp_file.write_bytes(creds.to_json().encode())
+        os.replace(tmp_file, TOKEN_FILE)
+        print(f"Token saved to {TOKEN_FILE}")
     
-    # Build and return Gmail service
-    service = build("gmail", "v1", credentials=creds)
+    # Build and return Gmail service (reused while the token is unchanged)
+    service = _service_cache.get(creds.token)
+    if service is None:
+        _service_cache.clear()
+        # Use the discovery document bundled with google-api-python-client
+        # instead of fetching it from googleapis.com on every start
+        service = build("gmail", "v1", credentials=creds, static_discovery=True)
+        _service_cache[creds.token] = service
     return service
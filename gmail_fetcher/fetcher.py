@@ -1,25 +1,66 @@
 """Gmail email fetching and PDF upload module."""
 
-import base64
+import os
 import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+
+import pybase64
 
 from .config import SEARCH_QUERY, DOWNLOADS_DIR
 from .supabase_client import (
     get_supabase_client,
     upload_pdf,
-    create_statement_record,
-    check_file_exists,
+    create_statement_records_batch,
+    get_existing_filenames,
+)
+
+# Gmail recommends at most 50 requests per batch to avoid rate limiting
+GMAIL_BATCH_SIZE = 50
+
+# Concurrent attachment uploads to Supabase Storage
+UPLOAD_WORKERS = 8
+
+# Partial response masks: only the fields we read (no inline body data)
+_PART_FIELDS = "filename,mimeType,body/attachmentId"
+MESSAGE_FIELDS = (
+    f"id,payload(headers,{_PART_FIELDS},"
+    f"parts({_PART_FIELDS},parts({_PART_FIELDS},parts({_PART_FIELDS}))))"
 )
+LIST_FIELDS = "messages/id,nextPageToken"
+
+# Message IDs per list() page (the API maximum; the default is 100)
+LIST_PAGE_SIZE = 500
+
+# Messages fetched and uploaded together; bounds how many PDFs are held in memory
+MESSAGE_WINDOW = GMAIL_BATCH_SIZE
+
+# Local fallback writes go to the kernel in 1 MiB slices
+WRITE_CHUNK_SIZE = 1 << 20
+
+# Filename sanitizing patterns, compiled once
+_SANITIZE_RE = re.compile(r'[<>:"/\\|?*]')
+_UNDERSCORE_RE = re.compile(r'_+')
+
+# Guards the shared set of known filenames across upload workers
+_claim_lock = threading.Lock()
 
 
 def fetch_and_upload_statements(service, use_supabase: bool = True) -> List[dict]:
     """
     Fetch emails matching the Zolve credit card statement query and upload PDF attachments.
     
+    Search results are listed a page at a time and processed in windows of
+    MESSAGE_WINDOW messages: each window's attachments are fetched, uploaded
+    concurrently and recorded in the database before the next window is
+    fetched. Only one window's PDFs are held in memory, and an error on a
+    later window never leaves this one's uploads without a statement record.
+    
     Args:
         service: Gmail API service instance
         use_supabase: If True, upload to Supabase. If False, save locally.
@@ -36,118 +77,390 @@ def fetch_and_upload_statements(service, use_supabase: bool = True) -> List[dict
     
     print(f"Searching for emails with query: {SEARCH_QUERY}")
     
-    # Search for matching emails
-    results = service.users().messages().list(
-        userId="me",
-        q=SEARCH_QUERY
-    ).execute()
+    total_messages = 0
+    existing = set()
     
-    messages = results.get("messages", [])
+    # Phase 2 (uploads) is I/O-bound, so run each window's attachments concurrently
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        for message_ids in _iter_message_id_pages(service):
+            total_messages += len(message_ids)
+            print(f"Found {len(message_ids)} matching email(s)")
+            
+            for start in range(0, len(message_ids), MESSAGE_WINDOW):
+                uploaded_files.extend(_process_window(
+                    service,
+                    supabase_client,
+                    executor,
+                    message_ids[start:start + MESSAGE_WINDOW],
+                    existing,
+                    use_supabase,
+                ))
     
-    if not messages:
+    if not total_messages:
         print("No matching emails found.")
-        return uploaded_files
     
-    print(f"Found {len(messages)} matching email(s)")
+    return uploaded_files
+
+
+def _process_window(
+    service,
+    supabase_client,
+    executor: ThreadPoolExecutor,
+    message_ids: List[str],
+    existing: set,
+    use_supabase: bool,
+) -> List[dict]:
+    """
+    Fetch, upload (or save) and record the PDF attachments of a window of messages.
     
-    # Process each email
-    for msg_info in messages:
-        msg_id = msg_info["id"]
+    Args:
+        service: Gmail API service instance
+        supabase_client: Supabase client (None when saving locally)
+        executor: Pool running _process_message for each message
+        message_ids: IDs of the messages in the window
+        existing: Filenames already stored; uploaded names are added to it
+        use_supabase: If True, upload to Supabase. If False, save locally.
         
-        # Get full message details
-        message = service.users().messages().get(
-            userId="me",
-            id=msg_id,
-            format="full"
-        ).execute()
+    Returns:
+        Created statement records, or saved files (filename, path) when local
+    """
+    # Phase 1: fetch the window's messages and PDF attachments in batched requests
+    fetched_messages, pdf_parts, fetched_attachments = _fetch_messages(service, message_ids)
+    
+    metadata = {
+        msg_id: _parse_headers(message)
+        for msg_id, message in fetched_messages.items()
+    }
+    
+    # Look up the window's already-stored files in one query instead of one per attachment
+    if use_supabase and supabase_client:
+        found = get_existing_filenames(supabase_client, [
+            _sanitize_filename(f"{metadata[msg_id][2]}_{attachment_name}")
+            for msg_id in metadata
+            for attachment_name, _, _ in pdf_parts[msg_id]
+        ])
+        with _claim_lock:
+            existing.update(found)
+    
+    futures = [
+        executor.submit(
+            _process_message,
+            supabase_client,
+            fetched_messages[msg_id],
+            metadata[msg_id],
+            pdf_parts[msg_id],
+            fetched_attachments,
+            existing,
+            use_supabase,
+        )
+        for msg_id in message_ids
+        if msg_id in fetched_messages
+    ]
+    
+    # One failed message must not cost the rest of the window its records
+    results = []
+    for future in as_completed(futures):
+        try:
+            results.extend(future.result())
+        except Exception as e:
+            print(f"  ✗ Error processing message: {e}")
+    
+    if not use_supabase or not supabase_client or not results:
+        return results
+    
+    # Create the database records for the window's uploaded files in one request
+    try:
+        return create_statement_records_batch(supabase_client, results)
+    except Exception as e:
+        print(f"✗ Error creating statement records: {e}")
+        return []
+
+
+# Keep the old function for backwards compatibility
+def fetch_and_download_statements(service) -> List[Path]:
+    """Legacy function - downloads to local storage."""
+    results = fetch_and_upload_statements(service, use_supabase=False)
+    return [Path(r["path"]) for r in results if "path" in r]
+
+
+def _iter_message_id_pages(service) -> Iterator[List[str]]:
+    """
+    Lazily page through the IDs of emails matching SEARCH_QUERY.
+    
+    Args:
+        service: Gmail API service instance
         
-        # Extract email metadata
-        headers = {h["name"]: h["value"] for h in message["payload"]["headers"]}
-        subject = headers.get("Subject", "No Subject")
-        date_str = headers.get("Date", "")
+    Yields:
+        List of message IDs per non-empty page (up to LIST_PAGE_SIZE)
+    """
+    messages = service.users().messages()
+    request = messages.list(
+        userId="me",
+        q=SEARCH_QUERY,
+        maxResults=LIST_PAGE_SIZE,
+        fields=LIST_FIELDS
+    )
+    
+    while request is not None:
+        response = request.execute()
+        message_ids = [msg_info["id"] for msg_info in response.get("messages", [])]
+        if message_ids:
+            yield message_ids
+        request = messages.list_next(request, response)
+
+
+def _fetch_messages(service, message_ids: List[str]) -> tuple:
+    """
+    Fetch messages and their PDF attachments in batched requests.
+    
+    Args:
+        service: Gmail API service instance
+        message_ids: IDs of the messages to fetch
         
-        # Parse email date
-        email_date = None
-        try:
-            email_date = parsedate_to_datetime(date_str)
-            date_prefix = email_date.strftime("%Y-%m-%d")
-        except:
-            date_prefix = datetime.now().strftime("%Y-%m-%d")
-            email_date = datetime.now()
+    Returns:
+        Tuple (fetched_messages, pdf_parts, fetched_attachments): dicts of
+        msg_id -> message resource, msg_id -> PDF parts (see _find_pdf_parts),
+        and "msg_id/attachment_id" -> attachment resource
+    """
+    fetched_messages = _execute_batched(service, [
+        (
+            msg_id,
+            service.users().messages().get(userId="me", id=msg_id, format="full", fields=MESSAGE_FIELDS),
+        )
+        for msg_id in message_ids
+    ])
+    
+    pdf_parts = {
+        msg_id: _find_pdf_parts(message["payload"])
+        for msg_id, message in fetched_messages.items()
+    }
+    
+    # Rare: PDFs small enough to be inline have no attachmentId, and the field
+    # mask dropped their data, so re-fetch just those messages in full
+    inline_msg_ids = [
+        msg_id for msg_id, parts in pdf_parts.items()
+        if any(attachment_id is None for _, attachment_id, _ in parts)
+    ]
+    if inline_msg_ids:
+        full_messages = _execute_batched(service, [
+            (msg_id, service.users().messages().get(userId="me", id=msg_id, format="full"))
+            for msg_id in inline_msg_ids
+        ])
+        for msg_id, message in full_messages.items():
+            pdf_parts[msg_id] = _find_pdf_parts(message["payload"])
+    
+    fetched_attachments = _execute_batched(service, [
+        (
+            f"{msg_id}/{attachment_id}",
+            service.users().messages().attachments().get(userId="me", messageId=msg_id, id=attachment_id),
+        )
+        for msg_id, parts in pdf_parts.items()
+        for _, attachment_id, _ in parts
+        if attachment_id
+    ])
+    
+    return fetched_messages, pdf_parts, fetched_attachments
+
+
+def _process_message(
+    supabase_client,
+    message: Dict[str, Any],
+    metadata: tuple,
+    parts: List[tuple],
+    fetched_attachments: Dict[str, Any],
+    existing: set,
+    use_supabase: bool,
+) -> List[dict]:
+    """
+    Decode a message's PDF attachments and upload (or save) them.
+    
+    Only touches already-fetched Gmail data, so it is safe to run in a
+    worker thread; the Gmail service itself is not thread-safe.
+    
+    Args:
+        supabase_client: Supabase client (None when saving locally)
+        message: Message resource from the Gmail API
+        metadata: (subject, email_date, date_prefix), as returned by _parse_headers
+        parts: PDF parts of the message, as returned by _find_pdf_parts
+        fetched_attachments: Dict of "msg_id/attachment_id" -> attachment resource
+        existing: Filenames already stored; uploaded names are added to it
+        use_supabase: If True, upload to Supabase. If False, save locally.
         
-        print(f"\nProcessing: {subject} ({date_prefix})")
+    Returns:
+        List of uploaded files (filename, storage_path, email_date) awaiting
+        a database record, or of saved files (filename, path) when local
+    """
+    records = []
+    msg_id = message["id"]
+    subject, email_date, date_prefix = metadata
+    
+    print(f"\nProcessing: {subject} ({date_prefix})")
+    
+    # Decode PDF attachments
+    attachments = []
+    for attachment_name, attachment_id, data in parts:
+        if attachment_id:
+            attachment = fetched_attachments.get(f"{msg_id}/{attachment_id}")
+            if attachment is None:
+                continue
+            data = attachment["data"]
+        elif not data:
+            continue
         
-        # Find and download PDF attachments
-        attachments = _get_pdf_attachments(service, msg_id, message["payload"])
+        # Decode base64url data (SIMD-accelerated drop-in for the base64 module)
+        attachments.append((attachment_name, pybase64.urlsafe_b64decode(data)))
+    
+    for attachment_name, attachment_data in attachments:
+        # Create safe filename
+        safe_name = _sanitize_filename(f"{date_prefix}_{attachment_name}")
         
-        for attachment_name, attachment_data in attachments:
-            # Create safe filename
-            safe_name = _sanitize_filename(f"{date_prefix}_{attachment_name}")
-            
-            if use_supabase and supabase_client:
-                # Check if file already exists
-                if check_file_exists(supabase_client, safe_name):
+        if use_supabase and supabase_client:
+            # Skip files already stored (or claimed by another worker this run)
+            with _claim_lock:
+                if safe_name in existing:
                     print(f"  ⏭ Skipped (already exists): {safe_name}")
                     continue
+                existing.add(safe_name)
+            
+            try:
+                # Upload to Supabase Storage
+                storage_path = upload_pdf(supabase_client, safe_name, attachment_data)
                 
-                try:
-                    # Upload to Supabase Storage
-                    storage_path = upload_pdf(supabase_client, safe_name, attachment_data)
-                    
-                    # Create database record
-                    record = create_statement_record(
-                        supabase_client,
-                        filename=safe_name,
-                        storage_path=storage_path,
-                        email_date=email_date
-                    )
-                    
-                    print(f"  ✓ Uploaded: {safe_name}")
-                    uploaded_files.append(record)
-                    
-                except Exception as e:
-                    print(f"  ✗ Error uploading {safe_name}: {e}")
-            else:
-                # Fallback: save locally
-                file_path = DOWNLOADS_DIR / safe_name
-                
-                if file_path.exists():
-                    base = file_path.stem
-                    ext = file_path.suffix
-                    counter = 1
-                    while file_path.exists():
-                        file_path = DOWNLOADS_DIR / f"{base}_{counter}{ext}"
-                        counter += 1
-                
-                with open(file_path, "wb") as f:
-                    f.write(attachment_data)
+                print(f"  ✓ Uploaded: {safe_name}")
+                records.append({
+                    "filename": safe_name,
+                    "storage_path": storage_path,
+                    "email_date": email_date,
+                })
                 
-                print(f"  ✓ Downloaded: {file_path.name}")
-                uploaded_files.append({"filename": file_path.name, "path": str(file_path)})
+            except Exception as e:
+                print(f"  ✗ Error uploading {safe_name}: {e}")
+        else:
+            # Fallback: save locally
+            file_path = DOWNLOADS_DIR / safe_name
+            try:
+                _write_file(file_path, attachment_data)
+            except FileExistsError:
+                # Taken (possibly by another worker); one random suffix instead
+                # of probing _1, _2, ... in turn
+                file_path = DOWNLOADS_DIR / f"{file_path.stem}_{uuid.uuid4().hex[:8]}{file_path.suffix}"
+                _write_file(file_path, attachment_data)
+            
+            print(f"  ✓ Downloaded: {file_path.name}")
+            records.append({"filename": file_path.name, "path": str(file_path)})
     
-    return uploaded_files
+    return records
 
 
-# Keep the old function for backwards compatibility
-def fetch_and_download_statements(service) -> List[Path]:
-    """Legacy function - downloads to local storage."""
-    results = fetch_and_upload_statements(service, use_supabase=False)
-    return [Path(r["path"]) for r in results if "path" in r]
+def _write_file(file_path: Path, data: bytes) -> None:
+    """
+    Write bytes to a file in WRITE_CHUNK_SIZE slices of a memoryview.
+    
+    Slicing the memoryview hands each chunk to os.write without copying it.
+    The file is created exclusively, so concurrent workers can never write
+    to the same path.
+    
+    Args:
+        file_path: Destination path (must not exist yet)
+        data: File contents
+        
+    Raises:
+        FileExistsError: If file_path already exists
+    """
+    view = memoryview(data)
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        offset = 0
+        while offset < len(view):
+            # os.write may write less than asked; continue from what it wrote
+            offset += os.write(fd, view[offset:offset + WRITE_CHUNK_SIZE])
+    finally:
+        os.close(fd)
+
+
+def _parse_headers(message: Dict[str, Any]) -> tuple:
+    """
+    Extract the subject and date from an email's headers.
+    
+    Args:
+        message: Message resource from the Gmail API
+        
+    Returns:
+        Tuple (subject, email_date, date_prefix); the date falls back to now
+        if the Date header is missing or malformed
+    """
+    # Scan for just the two headers we need, stopping once both are found
+    subject = date_str = None
+    for header in message["payload"]["headers"]:
+        name = header["name"]
+        if name == "Subject":
+            subject = header["value"]
+        elif name == "Date":
+            date_str = header["value"]
+        else:
+            continue
+        if subject is not None and date_str is not None:
+            break
+    
+    if subject is None:
+        subject = "No Subject"
+    if date_str is None:
+        date_str = ""
+    
+    # Parse email date
+    email_date = None
+    try:
+        email_date = parsedate_to_datetime(date_str)
+        date_prefix = email_date.strftime("%Y-%m-%d")
+    except:
+        date_prefix = datetime.now().strftime("%Y-%m-%d")
+        email_date = datetime.now()
+    
+    return subject, email_date, date_prefix
 
 
-def _get_pdf_attachments(service, msg_id: str, payload: Dict[str, Any]) -> List[tuple]:
+def _execute_batched(service, requests: List[tuple]) -> Dict[str, Any]:
     """
-    Extract PDF attachments from email payload.
+    Execute Gmail API requests as batch HTTP requests.
     
     Args:
         service: Gmail API service instance
-        msg_id: Message ID
+        requests: List of (request_id, request) tuples
+    
+    Returns:
+        Dict of request_id -> response (failed requests are reported and omitted)
+    """
+    responses = {}
+    
+    def on_response(request_id, response, exception):
+        if exception is not None:
+            print(f"  ✗ Gmail request failed ({request_id}): {exception}")
+        else:
+            responses[request_id] = response
+    
+    for start in range(0, len(requests), GMAIL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_response)
+        for request_id, request in requests[start:start + GMAIL_BATCH_SIZE]:
+            batch.add(request, request_id=request_id)
+        batch.execute()
+    
+    return responses
+
+
+def _find_pdf_parts(payload: Dict[str, Any]) -> List[tuple]:
+    """
+    Find PDF attachment parts in an email payload.
+    
+    Args:
         payload: Email payload dict
         
     Returns:
-        List of tuples (filename, binary_data)
+        List of tuples (filename, attachment_id, inline_data). Attachments
+        stored separately have an attachment_id to fetch; inline attachments
+        have attachment_id None and their base64url data instead (None if
+        the payload was fetched with MESSAGE_FIELDS, which omits body data).
     """
-    attachments = []
+    pdf_parts = []
     
     parts = payload.get("parts", [])
     
@@ -158,7 +471,7 @@ def _get_pdf_attachments(service, msg_id: str, payload: Dict[str, Any]) -> List[
     for part in parts:
         # Recurse into nested parts
         if part.get("parts"):
-            attachments.extend(_get_pdf_attachments(service, msg_id, part))
+            pdf_parts.extend(_find_pdf_parts(part))
             continue
         
         filename = part.get("filename", "")
@@ -170,22 +483,12 @@ def _get_pdf_attachments(service, msg_id: str, payload: Dict[str, Any]) -> List[
             attachment_id = body.get("attachmentId")
             
             if attachment_id:
-                # Fetch attachment data
-                attachment = service.users().messages().attachments().get(
-                    userId="me",
-                    messageId=msg_id,
-                    id=attachment_id
-                ).execute()
-                
-                # Decode base64url data
-                data = base64.urlsafe_b64decode(attachment["data"])
-                attachments.append((filename, data))
-            elif body.get("data"):
+                pdf_parts.append((filename, attachment_id, None))
+            else:
                 # Inline attachment
-                data = base64.urlsafe_b64decode(body["data"])
-                attachments.append((filename, data))
+                pdf_parts.append((filename, None, body.get("data")))
     
-    return attachments
+    return pdf_parts
 
 
 def _sanitize_filename(filename: str) -> str:
@@ -199,9 +502,9 @@ def _sanitize_filename(filename: str) -> str:
         Sanitized filename safe for filesystem
     """
     # Remove or replace invalid characters
-    sanitized = re.sub(r'[<>:"/\\|?*]', '_', filename)
+    sanitized = _SANITIZE_RE.sub('_', filename)
     # Collapse multiple underscores
-    sanitized = re.sub(r'_+', '_', sanitized)
+    sanitized = _UNDERSCORE_RE.sub('_', sanitized)
     # Limit length
     if len(sanitized) > 200:
         name, ext = sanitized.rsplit('.', 1) if '.' in sanitized else (sanitized, '')
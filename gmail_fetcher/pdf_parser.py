@@ -2,15 +2,29 @@
 
 import io
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional, Tuple
+from itertools import chain
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple, Union
 
-import pikepdf
-import pdfplumber
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
 
+# Patterns compiled once at import instead of per line/page
+_BILL_PERIOD_RE = re.compile(r"Bill Period:\s*(\d{2}-\d{2}-\d{4})\s*-\s*(\d{2}-\d{2}-\d{4})")
+_PREV_BAL_RE = re.compile(r"Previous Balance\s*\$?([\d,.]+)")
+_NEW_BAL_RE = re.compile(r"New Balance[^\$]*\$?([\d,.]+)")
+_TX_RE = re.compile(r"(\d{2}/\d{2}/\d{4})\s+(\d{2}/\d{2}/\d{4})\s+(.+?)\s+\$?([\d,.]+)\s*$")
 
-@dataclass
+# Shortest line _TX_RE can match: two dates, a 1-char description and amount
+_MIN_TX_LINE_LEN = 25
+
+# Columns transaction_arrays() can build
+TRANSACTION_COLUMNS = ("amounts", "amount_cents", "is_credit", "posted_dates", "descriptions")
+
+
+@dataclass(slots=True, frozen=True)
 class Transaction:
     """Represents a single transaction from a credit card statement."""
     posted_date: datetime
@@ -18,9 +32,14 @@ class Transaction:
     description: str
     amount: float
     transaction_type: str  # 'credit' or 'debit'
+    # Exact integer cents, for summing without float drift
+    amount_cents: int = field(init=False)
+    
+    def __post_init__(self):
+        object.__setattr__(self, "amount_cents", round(self.amount * 100))
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StatementSummary:
     """Summary information from the statement."""
     bill_period_start: Optional[datetime] = None
@@ -37,6 +56,9 @@ def decrypt_pdf(pdf_bytes: bytes, password: str) -> bytes:
     """
     Decrypt a password-protected PDF.
     
+    Kept for external callers; parsing no longer needs it, since
+    extract_text_from_pdf opens encrypted PDFs directly.
+    
     Args:
         pdf_bytes: Raw PDF bytes
         password: PDF password
@@ -44,45 +66,65 @@ def decrypt_pdf(pdf_bytes: bytes, password: str) -> bytes:
     Returns:
         Decrypted PDF bytes
     """
-    input_buffer = io.BytesIO(pdf_bytes)
     output_buffer = io.BytesIO()
     
-    with pikepdf.open(input_buffer, password=password) as pdf:
-        pdf.save(output_buffer)
+    pdf = pdfium.PdfDocument(pdf_bytes, password=password)
+    try:
+        pdf.save(output_buffer, flags=pdfium_c.FPDF_REMOVE_SECURITY)
+    finally:
+        pdf.close()
     
-    output_buffer.seek(0)
-    return output_buffer.read()
+    return output_buffer.getvalue()
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> List[str]:
+def extract_text_from_pdf(
+    pdf_bytes: Union[bytes, str, Path, BinaryIO],
+    password: Optional[str] = None
+) -> Iterator[str]:
     """
-    Extract text from each page of a PDF.
+    Extract text from each page of a PDF, one page at a time.
+    
+    Uses PDFium (native C++), which is far faster than a pure-Python parser.
     
     Args:
-        pdf_bytes: Decrypted PDF bytes
+        pdf_bytes: PDF bytes, encrypted or not, a file path (read by PDFium
+            on demand, without loading it into memory), or a binary file
+            object supporting seek/tell/readinto
+        password: PDF password, if encrypted
         
-    Returns:
-        List of text content per page
+    Yields:
+        Text content of each page
     """
-    buffer = io.BytesIO(pdf_bytes)
-    pages_text = []
-    
-    with pdfplumber.open(buffer) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text() or ""
-            pages_text.append(text)
-    
-    return pages_text
+    pdf = pdfium.PdfDocument(pdf_bytes, password=password)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            text = textpage.get_text_range()
+            # Free each page's native objects before moving on to the next one
+            textpage.close()
+            page.close()
+            yield text
+    finally:
+        pdf.close()
 
 
 def parse_date(date_str: str) -> Optional[datetime]:
     """Parse date string in MM/DD/YYYY format."""
+    # Fixed layout: slice the fields directly rather than going through strptime
+    s = date_str.strip()
+    if len(s) != 10 or s[2] != "/" or s[5] != "/":
+        return None
     try:
-        return datetime.strptime(date_str.strip(), "%m/%d/%Y")
+        return datetime(int(s[6:10]), int(s[0:2]), int(s[3:5]))
     except ValueError:
         return None
 
 
+def _parse_bill_date(date_str: str) -> datetime:
+    """Parse a DD-MM-YYYY bill period date; raises ValueError if invalid."""
+    return datetime(int(date_str[6:10]), int(date_str[3:5]), int(date_str[0:2]))
+
+
 def parse_amount(amount_str: str) -> float:
     """Parse amount string, removing $ and handling negative values."""
     # Remove $ and any whitespace
@@ -93,106 +135,233 @@ def parse_amount(amount_str: str) -> float:
     return float(cleaned)
 
 
-def parse_transactions(pages_text: List[str]) -> Tuple[List[Transaction], StatementSummary]:
+def _parse_summary(page_text: str) -> StatementSummary:
     """
-    Parse transactions from statement text.
+    Parse the statement summary from the first page's text.
     
     Args:
-        pages_text: List of text content per page
+        page_text: Text content of the first page
         
     Returns:
-        Tuple of (list of transactions, statement summary)
+        Statement summary (fields not found are None)
+    """
+    summary_fields = {}  # StatementSummary is frozen, so collect its fields first
+    
+    # Extract bill period
+    bill_period_match = _BILL_PERIOD_RE.search(page_text)
+    if bill_period_match:
+        try:
+            summary_fields["bill_period_start"] = _parse_bill_date(bill_period_match.group(1))
+            summary_fields["bill_period_end"] = _parse_bill_date(bill_period_match.group(2))
+        except ValueError:
+            pass
+    
+    # Extract balances
+    prev_balance_match = _PREV_BAL_RE.search(page_text)
+    if prev_balance_match:
+        summary_fields["previous_balance"] = parse_amount(prev_balance_match.group(1))
+    
+    new_balance_match = _NEW_BAL_RE.search(page_text)
+    if new_balance_match:
+        summary_fields["new_balance"] = parse_amount(new_balance_match.group(1))
+    
+    return StatementSummary(**summary_fields)
+
+
+def _parse_page_transactions(page_text: str) -> List[Transaction]:
+    """
+    Parse the transactions listed on one page.
+    
+    Args:
+        page_text: Text content of the page
+        
+    Returns:
+        List of transactions (empty unless the page has "Account Activity")
     """
     transactions = []
-    summary = StatementSummary()
     
-    # Parse first page for summary info
-    if pages_text:
-        first_page = pages_text[0]
+    if "Account Activity" not in page_text:
+        return transactions
+    
+    lines = page_text.split("\n")
+    current_section = None  # 'credits' or 'debits'
+    
+    for line in lines:
+        line = line.strip()
         
-        # Extract bill period
-        bill_period_match = re.search(r"Bill Period:\s*(\d{2}-\d{2}-\d{4})\s*-\s*(\d{2}-\d{2}-\d{4})", first_page)
-        if bill_period_match:
-            try:
-                summary.bill_period_start = datetime.strptime(bill_period_match.group(1), "%d-%m-%Y")
-                summary.bill_period_end = datetime.strptime(bill_period_match.group(2), "%d-%m-%Y")
-            except ValueError:
-                pass
+        # Detect section headers
+        if "Payments and Other Credits" in line:
+            current_section = "credit"
+            continue
+        elif "Purchases and Cash Advances" in line:
+            current_section = "debit"
+            continue
+        elif "Fees and Interest Charged" in line:
+            current_section = "fees"
+            continue
+        elif "Sub Total" in line or "No transaction available" in line:
+            continue
         
-        # Extract balances
-        prev_balance_match = re.search(r"Previous Balance\s*\$?([\d,.]+)", first_page)
-        if prev_balance_match:
-            summary.previous_balance = parse_amount(prev_balance_match.group(1))
+        # Skip non-transaction lines
+        if not current_section or current_section == "fees":
+            continue
         
-        new_balance_match = re.search(r"New Balance[^\$]*\$?([\d,.]+)", first_page)
-        if new_balance_match:
-            summary.new_balance = parse_amount(new_balance_match.group(1))
-    
-    # Parse transaction pages (typically page 2+)
-    for page_text in pages_text:
-        if "Account Activity" not in page_text:
+        # Cheap rejection of lines that cannot start with an MM/DD/ date
+        if (
+            len(line) < _MIN_TX_LINE_LEN
+            or line[2] != "/"
+            or line[5] != "/"
+            or not line[:2].isdigit()
+        ):
             continue
-            
-        lines = page_text.split("\n")
-        current_section = None  # 'credits' or 'debits'
         
-        for line in lines:
-            line = line.strip()
-            
-            # Detect section headers
-            if "Payments and Other Credits" in line:
-                current_section = "credit"
-                continue
-            elif "Purchases and Cash Advances" in line:
-                current_section = "debit"
-                continue
-            elif "Fees and Interest Charged" in line:
-                current_section = "fees"
-                continue
-            elif "Sub Total" in line or "No transaction available" in line:
-                continue
-            
-            # Skip non-transaction lines
-            if not current_section or current_section == "fees":
-                continue
-            
-            # Try to parse transaction line
-            # Format: MM/DD/YYYY MM/DD/YYYY Description $Amount
-            # Pattern matches: date date description amount
-            tx_match = re.match(
-                r"(\d{2}/\d{2}/\d{4})\s+(\d{2}/\d{2}/\d{4})\s+(.+?)\s+\$?([\d,.]+)\s*$",
-                line
-            )
+        # Try to parse transaction line
+        # Format: MM/DD/YYYY MM/DD/YYYY Description $Amount
+        # Pattern matches: date date description amount
+        tx_match = _TX_RE.match(line)
+        
+        if tx_match:
+            posted_date = parse_date(tx_match.group(1))
+            transaction_date = parse_date(tx_match.group(2))
+            description = tx_match.group(3).strip()
+            amount = parse_amount(tx_match.group(4))
             
-            if tx_match:
-                posted_date = parse_date(tx_match.group(1))
-                transaction_date = parse_date(tx_match.group(2))
-                description = tx_match.group(3).strip()
-                amount = parse_amount(tx_match.group(4))
-                
-                if posted_date and transaction_date:
-                    transactions.append(Transaction(
-                        posted_date=posted_date,
-                        transaction_date=transaction_date,
-                        description=description,
-                        amount=amount,
-                        transaction_type=current_section
-                    ))
+            if posted_date and transaction_date:
+                transactions.append(Transaction(
+                    posted_date=posted_date,
+                    transaction_date=transaction_date,
+                    description=description,
+                    amount=amount,
+                    transaction_type=current_section
+                ))
+    
+    return transactions
+
+
+def parse_transactions(pages_text: Iterable[str]) -> Tuple[List[Transaction], StatementSummary]:
+    """
+    Parse transactions from statement text.
+    
+    Pages are consumed in a single pass, so a generator such as
+    extract_text_from_pdf never needs to hold more than one page.
+    
+    Args:
+        pages_text: Text content per page (any iterable)
+        
+    Returns:
+        Tuple of (list of transactions, statement summary)
+    """
+    transactions = []
+    pages = iter(pages_text)
+    
+    # Parse first page for summary info
+    first_page = next(pages, None)
+    if first_page is None:
+        return transactions, StatementSummary()
+    summary = _parse_summary(first_page)
+    
+    # Parse transaction pages (typically page 2+, but the first page is scanned too)
+    for page_text in chain((first_page,), pages):
+        transactions.extend(_parse_page_transactions(page_text))
     
     return transactions, summary
 
 
-def parse_statement_pdf(pdf_bytes: bytes, password: str) -> Tuple[List[Transaction], StatementSummary]:
+def parse_statement_pdf(
+    pdf_bytes: Union[bytes, str, Path, BinaryIO],
+    password: str
+) -> Tuple[List[Transaction], StatementSummary]:
     """
     Main entry point: decrypt PDF and extract all transactions.
     
+    The PDF is decrypted while it is read, rather than re-serialized to
+    decrypted bytes and parsed a second time.
+    
     Args:
-        pdf_bytes: Raw password-protected PDF bytes
+        pdf_bytes: Raw password-protected PDF bytes, a file path, or a
+            binary file object (see extract_text_from_pdf)
         password: PDF password
         
     Returns:
         Tuple of (list of transactions, statement summary)
     """
-    decrypted = decrypt_pdf(pdf_bytes, password)
-    pages_text = extract_text_from_pdf(decrypted)
+    pages_text = extract_text_from_pdf(pdf_bytes, password=password)
     return parse_transactions(pages_text)
+
+
+def parse_statement_pdf_stream(
+    pdf_path: Union[bytes, str, Path, BinaryIO],
+    password: str,
+    page_batch: int = 50
+) -> Iterator[Tuple[List[Transaction], StatementSummary]]:
+    """
+    Parse a statement incrementally, page_batch pages at a time.
+    
+    Transactions from the first batch are available as soon as those pages
+    are parsed, and only one batch of transactions is held at a time.
+    
+    Args:
+        pdf_path: Path of the PDF (or anything extract_text_from_pdf accepts)
+        password: PDF password
+        page_batch: Number of pages parsed per yielded batch
+        
+    Yields:
+        Tuples of (transactions from the batch's pages, statement summary);
+        at least one tuple, even for a PDF without pages
+    """
+    pages = extract_text_from_pdf(pdf_path, password=password)
+    
+    first_page = next(pages, None)
+    if first_page is None:
+        yield [], StatementSummary()
+        return
+    summary = _parse_summary(first_page)
+    
+    transactions = []
+    for page_number, page_text in enumerate(chain((first_page,), pages), start=1):
+        transactions.extend(_parse_page_transactions(page_text))
+        if page_number % page_batch == 0:
+            yield transactions, summary
+            transactions = []
+    
+    # Final partial batch (always yielded when the PDF has fewer pages than one batch)
+    if transactions or page_number % page_batch:
+        yield transactions, summary
+
+
+def transaction_arrays(transactions: List[Transaction], columns: Iterable[str] = TRANSACTION_COLUMNS) -> dict:
+    """
+    Build a column (structure-of-arrays) view of transactions.
+    
+    Lets totals be computed as vectorized NumPy reductions instead of
+    Python-level attribute lookups and string comparisons per row. NumPy is
+    imported lazily, so parsing itself does not depend on it.
+    
+    Args:
+        transactions: Parsed transactions
+        columns: Columns to build (default all of TRANSACTION_COLUMNS); pass
+            only the ones needed, since posted_dates and descriptions are
+            built through Python lists
+        
+    Returns:
+        Dict of the requested NumPy arrays: amounts (float64), amount_cents
+        (int64), is_credit (bool), posted_dates (datetime64[D]) and
+        descriptions (object)
+        
+    Raises:
+        ImportError: If NumPy is not installed
+        KeyError: If a column name is not in TRANSACTION_COLUMNS
+    """
+    import numpy as np
+    
+    count = len(transactions)
+    builders = {
+        "amounts": lambda: np.fromiter((tx.amount for tx in transactions), dtype=np.float64, count=count),
+        "amount_cents": lambda: np.fromiter((tx.amount_cents for tx in transactions), dtype=np.int64, count=count),
+        "is_credit": lambda: np.fromiter(
+            (tx.transaction_type == "credit" for tx in transactions), dtype=np.bool_, count=count
+        ),
+        "posted_dates": lambda: np.array([tx.posted_date for tx in transactions], dtype="datetime64[D]"),
+        "descriptions": lambda: np.array([tx.description for tx in transactions], dtype=object),
+    }
+    return {name: builders[name]() for name in columns}
@@ -2,16 +2,33 @@
 
 from supabase import create_client, Client
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 import uuid
 
+import httpx
+from postgrest.exceptions import APIError
+
 from .config import SUPABASE_URL, SUPABASE_KEY, STORAGE_BUCKET
 
+# Rows per insert request, to stay well under PostgREST payload limits
+INSERT_CHUNK_SIZE = 1000
+
+# Values per in_() filter, to keep GET query strings under gateway URL limits
+FILTER_CHUNK_SIZE = 100
+
+# Postgres error raised by an upsert when no unique index matches on_conflict
+NO_UNIQUE_CONSTRAINT = "42P10"
 
+
+@lru_cache(maxsize=1)
 def get_supabase_client() -> Client:
     """
     Initialize and return Supabase client.
     
+    The client is created once per process and shared by all callers, so its
+    HTTP connections are reused instead of re-negotiated on every call.
+    
     Returns:
         Supabase client instance
         
@@ -27,10 +44,32 @@ def get_supabase_client() -> Client:
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 
+@lru_cache(maxsize=1)
+def _get_storage_http() -> httpx.Client:
+    """
+    Return the shared HTTP/2 client for Supabase Storage uploads.
+    
+    One connection is multiplexed across all (concurrent) uploads instead of
+    a TLS handshake per file.
+    """
+    get_supabase_client()  # Validates the credentials
+    return httpx.Client(
+        http2=True,
+        headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+        timeout=60,
+    )
+
+
 def upload_pdf(client: Client, filename: str, data: bytes) -> str:
     """
     Upload PDF to Supabase Storage.
     
+    The bytes are sent as the raw request body rather than through the SDK's
+    multipart upload, so the PDF is not copied into an intermediate buffer.
+    
+    A file that is already stored counts as uploaded, so a run that stopped
+    between the upload and the statement record can record it next time.
+    
     Args:
         client: Supabase client
         filename: Name for the file
@@ -43,15 +82,34 @@ def upload_pdf(client: Client, filename: str, data: bytes) -> str:
     storage_path = f"zolve/{filename}"
     
     # Upload to storage bucket
-    client.storage.from_(STORAGE_BUCKET).upload(
-        path=storage_path,
-        file=data,
-        file_options={"content-type": "application/pdf"}
+    response = _get_storage_http().post(
+        f"{SUPABASE_URL}/storage/v1/object/{STORAGE_BUCKET}/{storage_path}",
+        content=data,
+        headers={"Content-Type": "application/pdf", "x-upsert": "false"},
     )
+    if not _is_duplicate(response):
+        response.raise_for_status()
     
     return storage_path
 
 
+def _is_duplicate(response: httpx.Response) -> bool:
+    """
+    Check whether a Storage upload failed only because the object exists.
+    
+    Storage reports this as HTTP 409, or (older versions) as HTTP 400 with
+    statusCode "409" in the JSON body.
+    """
+    if response.status_code == 409:
+        return True
+    if response.status_code != 400:
+        return False
+    try:
+        return str(response.json().get("statusCode")) == "409"
+    except ValueError:
+        return False
+
+
 def create_statement_record(
     client: Client,
     filename: str,
@@ -68,7 +126,7 @@ def create_statement_record(
         email_date: Date from the email
         
     Returns:
-        Created record data
+        Created record data (empty if a record for the filename already exists)
     """
     record = {
         "filename": filename,
@@ -79,8 +137,69 @@ def create_statement_record(
     if email_date:
         record["email_date"] = email_date.isoformat()
     
-    result = client.table("statements").insert(record).execute()
-    return result.data[0] if result.data else {}
+    created = _upsert_statements(client, [record])
+    return created[0] if created else {}
+
+
+def create_statement_records_batch(client: Client, statements: list) -> list:
+    """
+    Create multiple statement records in a batch.
+    
+    Args:
+        client: Supabase client
+        statements: List of dicts with filename, storage_path and email_date
+        
+    Returns:
+        List of created records (filenames that already exist are skipped)
+    """
+    records = [
+        {
+            "filename": stmt["filename"],
+            "storage_path": stmt["storage_path"],
+            "status": "not_parsed",
+            "email_date": stmt["email_date"].isoformat() if stmt.get("email_date") else None,
+        }
+        for stmt in statements
+    ]
+    
+    if not records:
+        return []
+    
+    return _upsert_statements(client, records)
+
+
+def _upsert_statements(client: Client, records: list) -> list:
+    """
+    Insert statement records, skipping filenames that already have one.
+    
+    Uses an upsert on the unique filename index from sql/functions.sql; if
+    that index has not been created, falls back to filtering out existing
+    filenames and a plain insert.
+    
+    Args:
+        client: Supabase client
+        records: Statement rows to insert
+        
+    Returns:
+        List of created records
+    """
+    try:
+        # Idempotent on the unique filename index: a re-run never duplicates a row
+        result = (
+            client.table("statements")
+            .upsert(records, on_conflict="filename", ignore_duplicates=True)
+            .execute()
+        )
+    except APIError as e:
+        if e.code != NO_UNIQUE_CONSTRAINT:
+            raise
+        existing = get_existing_filenames(client, [record["filename"] for record in records])
+        records = [record for record in records if record["filename"] not in existing]
+        if not records:
+            return []
+        result = client.table("statements").insert(records).execute()
+    
+    return result.data if result.data else []
 
 
 def get_statements_by_status(client: Client, status: str) -> list:
@@ -119,6 +238,30 @@ def update_status(client: Client, statement_id: str, status: str) -> dict:
     return result.data[0] if result.data else {}
 
 
+def update_statuses(client: Client, statement_ids: list, status: str) -> list:
+    """
+    Update the status of multiple statements, FILTER_CHUNK_SIZE per request.
+    
+    Args:
+        client: Supabase client
+        statement_ids: UUIDs of the statements
+        status: New status
+        
+    Returns:
+        List of updated records
+    """
+    updated = []
+    for start in range(0, len(statement_ids), FILTER_CHUNK_SIZE):
+        result = (
+            client.table("statements")
+            .update({"status": status, "updated_at": datetime.now().isoformat()})
+            .in_("id", statement_ids[start:start + FILTER_CHUNK_SIZE])
+            .execute()
+        )
+        updated.extend(result.data or [])
+    return updated
+
+
 def check_file_exists(client: Client, filename: str) -> bool:
     """
     Check if a file with this filename already exists in the database.
@@ -134,6 +277,33 @@ def check_file_exists(client: Client, filename: str) -> bool:
     return len(result.data) > 0
 
 
+def get_existing_filenames(client: Client, filenames: list) -> set:
+    """
+    Find which of the given filenames already exist in the database.
+    
+    Args:
+        client: Supabase client
+        filenames: Filenames to check
+        
+    Returns:
+        Set of the filenames that already exist
+    """
+    unique = list(set(filenames))
+    found = set()
+    
+    # Chunked so a long page of names never exceeds the URL length limit
+    for start in range(0, len(unique), FILTER_CHUNK_SIZE):
+        result = (
+            client.table("statements")
+            .select("filename")
+            .in_("filename", unique[start:start + FILTER_CHUNK_SIZE])
+            .execute()
+        )
+        found.update(row["filename"] for row in result.data)
+    
+    return found
+
+
 def download_pdf(client: Client, storage_path: str) -> bytes:
     """
     Download PDF from Supabase Storage.
@@ -216,3 +386,25 @@ def insert_transactions_batch(client: Client, statement_id: str, transactions: l
     result = client.table("transactions").insert(records).execute()
     return result.data if result.data else []
 
+
+def insert_transaction_records(client: Client, records: list) -> int:
+    """
+    Insert transaction records for any number of statements.
+    
+    Unlike insert_transactions_batch, each record carries its own
+    statement_id, so many statements can be written in one request.
+    Records are sent INSERT_CHUNK_SIZE rows per request; those requests
+    are not atomic together, so callers wanting all-or-nothing per
+    statement pass at most INSERT_CHUNK_SIZE rows (see
+    parse_statements.group_by_statement).
+    
+    Args:
+        client: Supabase client
+        records: List of transaction dicts including statement_id
+        
+    Returns:
+        Number of records inserted
+    """
+    for start in range(0, len(records), INSERT_CHUNK_SIZE):
+        client.table("transactions").insert(records[start:start + INSERT_CHUNK_SIZE]).execute()
+    return len(records)
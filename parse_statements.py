@@ -11,22 +11,157 @@ This script:
 3. Decrypts and extracts transactions
 4. Saves transactions to the 'transactions' table
 5. Updates statement status to 'parsed'
+
+Downloads run in a thread pool and parsing in a process pool, so the
+stages overlap; all database writes stay in the main process and happen
+at the end of the run, in bulk inserts that each hold whole statements.
+Each insert's statements are marked parsed as soon as it succeeds.
 """
 
+import multiprocessing
 import os
 import sys
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import asdict
+from typing import Iterator, List, Tuple, Union
 from gmail_fetcher import (
     get_supabase_client,
     get_statements_by_status,
-    update_status,
+    update_statuses,
     download_pdf,
-    insert_transactions_batch,
+    insert_transaction_records,
     parse_statement_pdf,
 )
+from gmail_fetcher.supabase_client import INSERT_CHUNK_SIZE
 
 # PDF password for Zolve statements
 PDF_PASSWORD = os.getenv("PDF_PASSWORD")
 
+# PDFs larger than this are spooled to a temp file and parsed from disk
+SPOOL_THRESHOLD = 32 * 1024 * 1024
+
+# Concurrent PDF downloads from Supabase Storage
+DOWNLOAD_WORKERS = 8
+
+
+def spool_to_file(pdf_bytes: bytes) -> str:
+    """
+    Write PDF bytes to a temp file.
+    
+    The parser worker opens the file by path instead of receiving the bytes,
+    so the PDF is neither pickled across processes nor held in memory.
+    
+    Args:
+        pdf_bytes: PDF binary data
+    
+    Returns:
+        Path of the spooled file (caller deletes it)
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(pdf_bytes)
+        return tmp.name
+
+
+def fetch_pdf(client, storage_path: str) -> Union[bytes, str]:
+    """
+    Download a PDF, spooling it to disk if it is large.
+    
+    Args:
+        client: Supabase client
+        storage_path: Path in Supabase Storage
+    
+    Returns:
+        PDF bytes, or the path of a spooled temp file
+    """
+    pdf_bytes = download_pdf(client, storage_path)
+    if len(pdf_bytes) > SPOOL_THRESHOLD:
+        return spool_to_file(pdf_bytes)
+    return pdf_bytes
+
+
+def _parse_one(statement_id: str, pdf_source: Union[bytes, str], password: str) -> Tuple[list, dict]:
+    """
+    Parse one statement in a worker process.
+    
+    Args:
+        statement_id: UUID of the statement, stored on each transaction
+        pdf_source: PDF bytes, or the path of a spooled PDF file
+        password: PDF password
+    
+    Returns:
+        Tuple of (list of transaction dicts, statement summary dict);
+        plain dicts so the result pickles cheaply back to the main process
+    """
+    # PDFium reads a path on demand, so spooled files are never loaded whole
+    transactions, summary = parse_statement_pdf(pdf_source, password)
+    
+    # Convert to dict format for insertion
+    tx_dicts = [
+        {
+            "statement_id": statement_id,
+            "posted_date": tx.posted_date.isoformat(),
+            "transaction_date": tx.transaction_date.isoformat(),
+            "description": tx.description,
+            "amount": tx.amount,
+            "transaction_type": tx.transaction_type,
+        }
+        for tx in transactions
+    ]
+    return tx_dicts, asdict(summary)
+
+
+def group_by_statement(parsed: List[Tuple[str, list]]) -> Iterator[Tuple[list, list]]:
+    """
+    Group parsed statements into inserts of up to INSERT_CHUNK_SIZE rows.
+    
+    Groups never split a statement, so each insert either saves a
+    statement's transactions completely or not at all. A statement with
+    more rows than INSERT_CHUNK_SIZE forms a group of its own.
+    
+    Args:
+        parsed: List of (statement_id, transaction dicts)
+    
+    Yields:
+        Tuple of (statement IDs, transaction dicts) per group
+    """
+    group_ids, group_rows = [], []
+    for stmt_id, tx_dicts in parsed:
+        if group_ids and len(group_rows) + len(tx_dicts) > INSERT_CHUNK_SIZE:
+            yield group_ids, group_rows
+            group_ids, group_rows = [], []
+        group_ids.append(stmt_id)
+        group_rows.extend(tx_dicts)
+    if group_ids:
+        yield group_ids, group_rows
+
+
+def save_parsed(client, parsed: List[Tuple[str, list]]) -> int:
+    """
+    Insert parsed transactions and mark their statements parsed.
+    
+    Each group's statements are marked parsed right after its insert, and
+    marked error if the insert fails, so a failed run never leaves inserted
+    transactions on a statement that will be parsed again.
+    
+    Args:
+        client: Supabase client
+        parsed: List of (statement_id, transaction dicts)
+    
+    Returns:
+        Number of transactions inserted
+    """
+    total = 0
+    for stmt_ids, tx_dicts in group_by_statement(parsed):
+        try:
+            total += insert_transaction_records(client, tx_dicts)
+        except Exception as e:
+            print(f"✗ Error inserting transactions for {len(stmt_ids)} statement(s): {e}")
+            update_statuses(client, stmt_ids, "error")
+            continue
+        update_statuses(client, stmt_ids, "parsed")
+    return total
+
 
 def main():
     """Main entry point."""
@@ -51,62 +186,74 @@ def main():
         
         print(f"Found {len(statements)} unparsed statement(s)\n")
         
-        total_transactions = 0
+        parsed = []
+        error_ids = []
         
-        # Process each statement
-        for stmt in statements:
-            stmt_id = stmt["id"]
-            filename = stmt.get("filename", "unknown")
-            storage_path = stmt.get("storage_path", "")
-            
-            print(f"Processing: {filename}")
-            
-            if not storage_path:
-                print(f"  ✗ No storage path found, skipping")
-                continue
+        # Parser workers are spawned, not forked: they start while download
+        # threads may hold locks (ssl, httpx), which a forked child would inherit
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_pool, \
+                ProcessPoolExecutor(
+                    max_workers=os.cpu_count(),
+                    mp_context=multiprocessing.get_context("spawn"),
+                ) as parse_pool:
+            # future -> (stage, statement, pdf_source)
+            pending = {}
             
-            try:
-                # Update status to 'parsing'
-                update_status(client, stmt_id, "parsing")
+            # Start downloading every statement
+            for stmt in statements:
+                filename = stmt.get("filename", "unknown")
+                storage_path = stmt.get("storage_path", "")
                 
-                # Download PDF from storage
-                print(f"  Downloading from storage...")
-                pdf_bytes = download_pdf(client, storage_path)
+                if not storage_path:
+                    print(f"✗ {filename}: No storage path found, skipping")
+                    continue
                 
-                # Parse transactions from PDF
-                print(f"  Extracting transactions...")
-                transactions, summary = parse_statement_pdf(pdf_bytes, PDF_PASSWORD)
+                future = download_pool.submit(fetch_pdf, client, storage_path)
+                pending[future] = ("download", stmt, None)
+            
+            print(f"Downloading and parsing {len(pending)} statement(s)...\n")
+            
+            # Hand each download to a parser as it lands; save each parse as it finishes
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
                 
-                if transactions:
-                    # Convert to dict format for insertion
-                    tx_dicts = [
-                        {
-                            "posted_date": tx.posted_date.isoformat(),
-                            "transaction_date": tx.transaction_date.isoformat(),
-                            "description": tx.description,
-                            "amount": tx.amount,
-                            "transaction_type": tx.transaction_type,
-                        }
-                        for tx in transactions
-                    ]
+                for future in done:
+                    stage, stmt, pdf_source = pending.pop(future)
+                    stmt_id = stmt["id"]
+                    filename = stmt.get("filename", "unknown")
                     
-                    # Insert transactions to database
-                    print(f"  Inserting {len(tx_dicts)} transactions...")
-                    insert_transactions_batch(client, stmt_id, tx_dicts)
-                    total_transactions += len(tx_dicts)
+                    try:
+                        if stage == "download":
+                            pdf_source = future.result()
+                            parse_future = parse_pool.submit(_parse_one, stmt_id, pdf_source, PDF_PASSWORD)
+                            pending[parse_future] = ("parse", stmt, pdf_source)
+                            continue
+                        
+                        tx_dicts, summary = future.result()
+                        
+                        if tx_dicts:
+                            print(f"✓ {filename}: Parsed {len(tx_dicts)} transactions")
+                        else:
+                            print(f"⚠ {filename}: No transactions found in statement")
+                        
+                        parsed.append((stmt_id, tx_dicts))
                     
-                    print(f"  ✓ Parsed {len(transactions)} transactions")
-                else:
-                    print(f"  ⚠ No transactions found in statement")
-                
-                # Update status to 'parsed'
-                update_status(client, stmt_id, "parsed")
-                
-            except Exception as e:
-                print(f"  ✗ Error: {e}")
-                # Update status to 'error'
-                update_status(client, stmt_id, "error")
-                continue
+                    except Exception as e:
+                        print(f"✗ {filename}: Error: {e}")
+                        error_ids.append(stmt_id)
+                    
+                    finally:
+                        # Remove the spool file once its parse has finished (or failed)
+                        if stage == "parse" and isinstance(pdf_source, str):
+                            os.unlink(pdf_source)
+        
+        # Statements that failed to download or parse
+        update_statuses(client, error_ids, "error")
+        
+        # Insert transactions from all statements, in chunks of whole statements
+        if parsed:
+            print(f"\nInserting transactions for {len(parsed)} statement(s)...")
+        total_transactions = save_parsed(client, parsed)
         
         # Summary
         print()
@@ -114,7 +261,7 @@ def main():
         print(f"✓ Processed {len(statements)} statement(s)")
         print(f"✓ Extracted {total_transactions} total transactions")
         print("=" * 60)
-        
+    
     except ValueError as e:
         print(f"Configuration Error: {e}")
         return 1
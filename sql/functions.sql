@@ -0,0 +1,106 @@
+-- Database functions used by the analysis tools (agents/tools.py) and the
+-- categorizer, plus the indexes the app relies on.
+-- Run this in the Supabase Dashboard → SQL Editor. Safe to re-run.
+
+-- One record per statement file, so statement inserts can be idempotent
+-- (upsert on_conflict="filename" in gmail_fetcher/supabase_client.py)
+CREATE UNIQUE INDEX IF NOT EXISTS statements_filename_key ON statements (filename);
+
+-- Spending totals per category ("Get Category Stats")
+CREATE OR REPLACE FUNCTION category_spending()
+RETURNS TABLE (category TEXT, total NUMERIC, count BIGINT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT COALESCE(t.category, 'Uncategorized'), SUM(t.amount), COUNT(*)
+    FROM transactions t
+    WHERE t.transaction_type = 'debit'
+    GROUP BY 1
+    ORDER BY 2 DESC;
+$$;
+
+-- Spending totals per month ("Get Monthly Trends")
+CREATE OR REPLACE FUNCTION monthly_spending()
+RETURNS TABLE (month TEXT, total NUMERIC)
+LANGUAGE sql STABLE
+AS $$
+    SELECT to_char(t.transaction_date, 'YYYY-MM'), SUM(t.amount)
+    FROM transactions t
+    WHERE t.transaction_type = 'debit'
+    GROUP BY 1
+    ORDER BY 1;
+$$;
+
+-- Set the category of many transactions in one statement
+-- (categorize_transactions.py). Only the category column is written, and
+-- only UPDATE permission on transactions is needed.
+CREATE OR REPLACE FUNCTION update_categories_bulk(ids UUID[], cats TEXT[])
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH updated AS (
+        UPDATE transactions t
+        SET category = u.category
+        FROM unnest(ids, cats) AS u(id, category)
+        WHERE t.id = u.id
+        RETURNING 1
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
+
+-- Fingerprint of the debit rows (analyze_spending.py reuses a cached
+-- analysis only while this is unchanged). Every row is hashed, so edits
+-- such as a new category change it, not just inserts.
+CREATE OR REPLACE FUNCTION debit_fingerprint()
+RETURNS TABLE (row_count BIGINT, last_created TEXT, digest TEXT)
+LANGUAGE sql STABLE
+AS $$
+    SELECT COUNT(*), MAX(t.created_at)::TEXT,
+           md5(COALESCE(string_agg(
+               concat_ws('|', t.id, t.transaction_date, t.description, t.amount, t.category),
+               E'\n' ORDER BY t.id
+           ), ''))
+    FROM transactions t
+    WHERE t.transaction_type = 'debit';
+$$;
+
+-- Potential duplicates and unusually large debits ("Detect Anomalies").
+-- "Large" means above median + 5 * MAD (median absolute deviation), or
+-- above 3x the mean when the MAD is 0.
+CREATE OR REPLACE FUNCTION detect_anomalies()
+RETURNS TABLE (transaction_date DATE, description TEXT, amount NUMERIC, kind TEXT, ratio NUMERIC)
+LANGUAGE sql STABLE
+AS $$
+    WITH debits AS (
+        SELECT * FROM transactions t WHERE t.transaction_type = 'debit'
+    ),
+    stats AS (
+        SELECT AVG(d.amount) AS avg_amount,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY d.amount)::NUMERIC AS median_amount
+        FROM debits d
+    ),
+    spread AS (
+        SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY abs(d.amount - s.median_amount))::NUMERIC AS mad
+        FROM debits d, stats s
+    ),
+    -- One pass: number rows within each (date, description prefix, amount) key
+    keyed AS (
+        SELECT d.*, ROW_NUMBER() OVER (
+            PARTITION BY d.transaction_date, left(d.description, 30), d.amount
+            ORDER BY d.id
+        ) AS occurrence
+        FROM debits d
+    )
+    -- Every repeat after the first occurrence, matching the in-memory fallback
+    SELECT k.transaction_date::DATE, k.description::TEXT, k.amount::NUMERIC,
+           'Potential Duplicate', NULL::NUMERIC
+    FROM keyed k
+    WHERE k.occurrence > 1
+    UNION ALL
+    SELECT d.transaction_date::DATE, d.description::TEXT, d.amount::NUMERIC,
+           'Unusually Large', d.amount / NULLIF(s.median_amount, 0)
+    FROM debits d, stats s, spread m
+    WHERE d.amount > CASE
+        WHEN m.mad > 0 THEN s.median_amount + 5 * m.mad
+        ELSE 3 * s.avg_amount
+    END;
+$$;
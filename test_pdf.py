@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 """Test PDF parser with a local PDF file."""
 
+import hashlib
+import mmap
 import os
+import pickle
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
-from gmail_fetcher.pdf_parser import parse_statement_pdf
+from gmail_fetcher.pdf_parser import parse_statement_pdf, parse_statement_pdf_stream, transaction_arrays
 
 # Load environment variables
 load_dotenv()
@@ -12,38 +16,120 @@ load_dotenv()
 PDF_PATH = Path("/Applications/All_Folders/PersonalProjects/agentic-ledger-ai/downloads/2024-03-16_ZOLVE_CREDIT_STATEMENT_03_15_2024.pdf")
 PASSWORD = os.getenv("PDF_PASSWORD")
 
-def test_parser():
-    """Test transaction extraction."""
-    print(f"Testing: {PDF_PATH.name}\n")
+# Parse results cached by PDF content hash; set LEDGER_CACHE=1 to enable
+CACHE_DIR = Path(__file__).parent / ".cache"
+USE_CACHE = os.getenv("LEDGER_CACHE") == "1"
+# Bump when the pickled Transaction/StatementSummary layout changes
+CACHE_VERSION = 2
+
+
+def cache_key(pdf_path: Path, password: str) -> str:
+    """BLAKE2b fingerprint of the PDF, keyed by the (hashed) password."""
+    password_key = hashlib.blake2b((password or "").encode(), digest_size=32).digest()
+    # Hash straight from the page cache via mmap rather than reading a bytes copy
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return hashlib.blake2b(mm, digest_size=16, key=password_key).hexdigest()
+
+
+def parse_cached(pdf_path: Path, password: str):
+    """Parse a statement, reusing a pickled result for identical PDFs."""
+    cache_file = CACHE_DIR / f"{cache_key(pdf_path, password)}-v{CACHE_VERSION}.pkl"
+    if cache_file.exists():
+        with open(cache_file, "rb") as f:
+            return pickle.load(f)
     
-    # Read PDF bytes
-    with open(PDF_PATH, "rb") as f:
-        pdf_bytes = f.read()
+    result = parse_statement_pdf(pdf_path, password)
     
-    # Parse statement
-    transactions, summary = parse_statement_pdf(pdf_bytes, PASSWORD)
+    # Write atomically so an interrupted run never leaves a partial pickle
+    CACHE_DIR.mkdir(exist_ok=True)
+    tmp_file = cache_file.with_suffix(".tmp")
+    with open(tmp_file, "wb") as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, cache_file)
     
-    # Print summary
-    print("=" * 60)
-    print("STATEMENT SUMMARY")
-    print("=" * 60)
-    print(f"Bill Period: {summary.bill_period_start} - {summary.bill_period_end}")
-    print(f"Previous Balance: ${summary.previous_balance}")
-    print(f"New Balance: ${summary.new_balance}")
-    print()
+    return result
+
+
+def parse_batches(pdf_path: Path, password: str):
+    """Yield (transactions, summary) page batches; one batch from the cache when enabled."""
+    if USE_CACHE:
+        yield parse_cached(pdf_path, password)
+    else:
+        yield from parse_statement_pdf_stream(pdf_path, password)
+
+
+def split_totals(transactions) -> tuple:
+    """Return (credit_cents, debit_cents) for a list of transactions."""
+    # Totals in exact integer cents, over the transactions' columns
+    try:
+        # Only the two columns the totals need
+        columns = transaction_arrays(transactions, ("amount_cents", "is_credit"))
+        cents, is_credit = columns["amount_cents"], columns["is_credit"]
+        try:
+            # Single-pass compiled kernel when Numba is installed
+            from gmail_fetcher._fastsum import split_sum
+        except ImportError:
+            return int(cents[is_credit].sum()), int(cents[~is_credit].sum())
+        credit_cents, debit_cents = split_sum(cents, is_credit)
+        return int(credit_cents), int(debit_cents)
+    except ImportError:
+        # NumPy not installed: accumulate both totals in one plain pass
+        credit_cents = 0
+        debit_cents = 0
+        for tx in transactions:
+            if tx.transaction_type == "credit":
+                credit_cents += tx.amount_cents
+            else:
+                debit_cents += tx.amount_cents
+        return credit_cents, debit_cents
+
+
+def test_parser():
+    """Test transaction extraction."""
+    print(f"Testing: {PDF_PATH.name}\n")
     
-    # Print transactions
-    print("=" * 60)
-    print(f"TRANSACTIONS ({len(transactions)} found)")
-    print("=" * 60)
+    count = 0
+    credit_cents = 0
+    debit_cents = 0
     
-    for tx in transactions:
-        tx_type = "+" if tx.transaction_type == "credit" else "-"
-        print(f"{tx.posted_date.strftime('%m/%d/%Y')} | {tx_type}${tx.amount:,.2f} | {tx.description[:50]}")
+    # Parse statement a batch of pages at a time, printing each batch as soon as it is parsed
+    for batch_number, (transactions, summary) in enumerate(parse_batches(PDF_PATH, PASSWORD)):
+        if batch_number == 0:
+            # Print summary
+            print("=" * 60)
+            print("STATEMENT SUMMARY")
+            print("=" * 60)
+            print(f"Bill Period: {summary.bill_period_start} - {summary.bill_period_end}")
+            print(f"Previous Balance: ${summary.previous_balance}")
+            print(f"New Balance: ${summary.new_balance}")
+            print()
+            
+            # Print transactions
+            print("=" * 60)
+            print("TRANSACTIONS")
+            print("=" * 60)
+        
+        batch_credit, batch_debit = split_totals(transactions)
+        credit_cents += batch_credit
+        debit_cents += batch_debit
+        count += len(transactions)
+        
+        if not transactions:
+            continue
+        
+        # Format the batch's lines, then write once (the date format spec skips a strftime call)
+        lines = []
+        append = lines.append
+        for tx in transactions:
+            append(f"{tx.posted_date:%m/%d/%Y} | {'+' if tx.transaction_type == 'credit' else '-'}${tx.amount:,.2f} | {tx.description[:50]}")
+        sys.stdout.write("\n".join(lines))
+        sys.stdout.write("\n")
     
     print()
-    print(f"Total credits: ${sum(tx.amount for tx in transactions if tx.transaction_type == 'credit'):,.2f}")
-    print(f"Total debits: ${sum(tx.amount for tx in transactions if tx.transaction_type == 'debit'):,.2f}")
+    print(f"Transactions found: {count}")
+    print(f"Total credits: ${credit_cents / 100:,.2f}")
+    print(f"Total debits: ${debit_cents / 100:,.2f}")
+
 
 if __name__ == "__main__":
     test_parser()